@@ -15,6 +15,8 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "")
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
+    # Optional, carries ticket notifications from other processes to the bot
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
     
     # OpenAI Configuration
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
@@ -28,6 +30,12 @@ class Settings(BaseSettings):
     GITHUB_WEBHOOK_SECRET: str = os.getenv("GITHUB_WEBHOOK_SECRET", "")
     GITHUB_NOTIFICATIONS_CHANNEL: str = os.getenv("GITHUB_NOTIFICATIONS_CHANNEL", "")
     
+    # Ticket Configuration
+    TICKET_NOTIFICATIONS_CHANNEL: str = os.getenv("TICKET_NOTIFICATIONS_CHANNEL", "0")
+    TICKET_CACHE_SIZE: int = int(os.getenv("TICKET_CACHE_SIZE", "1000"))
+    TICKET_CACHE_TTL: int = int(os.getenv("TICKET_CACHE_TTL", "300"))
+    TICKET_SIMILARITY_INDEX_PATH: str = os.getenv("TICKET_SIMILARITY_INDEX_PATH", "ticket_similarity.idx")
+    
     # Webhook Server Configuration
     WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
     WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "5000"))
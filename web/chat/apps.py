@@ -9,4 +9,4 @@ class ChatConfig(AppConfig):
         """
         Initialize any chat app specific signals or configurations
         """
-        pass  # Add any initialization code here if needed
\ No newline at end of file
+        from . import signals  # noqa: F401
\ No newline at end of file
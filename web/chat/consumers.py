@@ -1,185 +1,379 @@
-import json
-from channels.generic.websocket import AsyncWebsocketConsumer
+import asyncio
 from channels.db import database_sync_to_async
-from django.utils import timezone
-from .models import Conversation, Message
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.db import IntegrityError
+from . import downloads, protocol
+from .event_log import event_log
+from .models import Conversation, FileUpload, Message
 from .message_router import message_router
+from .outbound import SLOW_CONSUMER_CLOSE_CODE, OutboundQueue
+from .presence import PRESENCE_GROUP, presence_service
+from .submissions import EXPIRED, submission_log
+from .uploads import UploadSession
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
         self.conversation_id = self.scope["url_route"]["kwargs"]["conversation_id"]
         self.room_group_name = f"chat_{self.conversation_id}"
+        self.outbound = OutboundQueue(self.send_encoded, max_size=settings.CHAT_OUTBOUND_QUEUE_SIZE)
+        self.slow_consumer = False
+        self.first_live_seq = None
+        self.turn_tasks = set()
 
-        # Join room group
+        # Load the conversation once and keep it for the lifetime of the socket
+        try:
+            self.conversation = await Conversation.objects.aget(id=self.conversation_id)
+        except Conversation.DoesNotExist:
+            await self.close()
+            return
+        self.uploads = UploadSession(self.conversation, self.user)
+
+        # Join room group and the team presence group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        await self.channel_layer.group_add(
+            PRESENCE_GROUP,
+            self.channel_name
+        )
 
-        await self.accept()
+        # Negotiate the frame encoding, JSON stays the default
+        subprotocol = protocol.negotiate_subprotocol(self.scope.get("subprotocols", []))
+        self.codec = protocol.codec_for(subprotocol)
+        await self.accept(subprotocol=subprotocol)
+        self.outbound.start()
 
         # Send initial team status
         await self.send_team_status()
 
     async def disconnect(self, close_code):
-        # Leave room group
+        await self.outbound.stop()
+
+        # Leave room and presence groups
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        await self.channel_layer.group_discard(
+            PRESENCE_GROUP,
+            self.channel_name
+        )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """
         Handle incoming WebSocket messages
         """
         try:
-            data = json.loads(text_data)
+            data = protocol.decode(text_data, bytes_data)
             message_type = data.get('type', 'message')
 
             if message_type == 'heartbeat':
                 return
 
             if message_type == 'message':
-                # Save message to database
-                message = await self.save_message(data['content'])
-                
-                # Send message to room group
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "chat_message",
-                        "message": {
-                            "id": message.id,
-                            "content": message.content,
-                            "role": "user",
-                            "created_at": message.created_at.isoformat(),
-                        }
-                    }
-                )
+                await self.submit_message(data)
+
+            elif message_type == 'resume':
+                await self.resume(int(data.get('after_seq', 0)))
 
-                # Process message through router
-                await self.process_message(message)
+            elif message_type == 'file_upload_start':
+                await self.handle_file_upload_start(data)
 
-            elif message_type == 'file_upload':
-                await self.handle_file_upload(data)
+            elif message_type == 'file_upload_resume':
+                await self.handle_file_upload_resume(data)
+
+            elif message_type == 'file_chunk':
+                await self.handle_file_chunk(data)
 
             elif message_type == 'file_download':
                 await self.handle_file_download(data)
 
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.send_payload({
                 "type": "error",
                 "message": str(e)
-            }))
+            })
 
     async def chat_message(self, event):
         """
         Send message to WebSocket
         """
-        await self.send(text_data=json.dumps(event["message"]))
+        self.note_live_seq(event)
+        await self.send_frames(event["frames"])
 
     async def team_status(self, event):
         """
         Send team status update to WebSocket
         """
-        await self.send(text_data=json.dumps({
-            "type": "status",
-            "role": event["role"],
-            "status": event["status"]
-        }))
+        await self.send_frames(event["frames"], event.get("coalesce"))
 
     async def ticket_update(self, event):
         """
         Send ticket update to WebSocket
         """
-        await self.send(text_data=json.dumps({
-            "type": "ticket",
-            "ticket": event["ticket"]
-        }))
+        self.note_live_seq(event)
+        await self.send_frames(event["frames"], event.get("coalesce"))
+
+    def note_live_seq(self, event):
+        """
+        Remember the first sequenced event this socket received live
+        """
+        if self.first_live_seq is None and "seq" in event:
+            self.first_live_seq = event["seq"]
 
-    @database_sync_to_async
-    def save_message(self, content):
+    async def resume(self, after_seq):
+        """
+        Replay events missed since after_seq, or ask the client to resync
+        """
+        events = await event_log.aread_after(self.conversation_id, after_seq)
+        if events is None:
+            # Gap is older than the replay buffer, reload history over HTTP
+            await self.send_payload({"type": "resync"})
+            return
+
+        for payload in events:
+            # Everything from the first live event on was already delivered
+            if self.first_live_seq is not None and payload["seq"] >= self.first_live_seq:
+                break
+            await self.send_payload(payload)
+
+        await self.send_payload({"type": "resumed", "after_seq": after_seq})
+
+    async def submit_message(self, data):
+        """
+        Store and process a submitted message, once per client_id
+        """
+        client_id = data.get('client_id')
+        if client_id and not await submission_log.aclaim(self.conversation_id, client_id):
+            # Retried submission, answer with what the first attempt produced
+            await self.send_submission_state(client_id)
+            return
+
+        try:
+            message = await self.save_message(data['content'], client_id)
+        except IntegrityError:
+            # The claim expired but an earlier attempt stored the message
+            await submission_log.arelease(self.conversation_id, client_id)
+            await self.send_submission_state(client_id)
+            return
+        except Exception:
+            if client_id:
+                await submission_log.arelease(self.conversation_id, client_id)
+            raise
+
+        if client_id:
+            await submission_log.arecord_message(self.conversation_id, client_id, message.id)
+
+        # Send message to room group, encoded once for every listener
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            await event_log.aevent(self.conversation_id, "chat_message", self.message_payload(message))
+        )
+
+        # Process message through router without holding up this socket's
+        # other frames; the turn queue keeps the conversation's turns in order
+        task = asyncio.create_task(self.process_message(message))
+        self.turn_tasks.add(task)
+        task.add_done_callback(self.turn_tasks.discard)
+
+    async def send_submission_state(self, client_id):
+        """
+        Send the stored message and AI reply of an earlier submission
+        """
+        state = await submission_log.aget(self.conversation_id, client_id)
+        message = await Message.objects.filter(
+            conversation=self.conversation,
+            client_id=client_id
+        ).afirst()
+
+        await self.send_payload({
+            "type": "message_ack",
+            "client_id": client_id,
+            "duplicate": True,
+            "message": self.message_payload(message) if message else None,
+            # Once the claim expires the reply is only in the conversation history
+            "status": state["status"] if state else EXPIRED,
+            "reply": state["reply"] if state else None
+        })
+
+    def message_payload(self, message):
+        """
+        Build the client payload for a user message
+        """
+        return {
+            "id": message.id,
+            "client_id": message.client_id,
+            "content": message.content,
+            "role": "user",
+            "created_at": message.created_at.isoformat(),
+        }
+
+    async def save_message(self, content, client_id=None):
         """
         Save message to database
         """
-        conversation = Conversation.objects.get(id=self.conversation_id)
-        return Message.objects.create(
-            conversation=conversation,
-            role='user',
-            content=content
+        return await Message.objects.acreate(
+            conversation=self.conversation,
+            user=self.user,
+            content=content,
+            is_ai=False,
+            client_id=client_id or None
         )
 
-    @database_sync_to_async
-    def process_message(self, message):
+    async def process_message(self, message):
         """
         Process message through router
         """
-        message_router.process_message(
-            conversation_id=self.conversation_id,
-            message_content=message.content,
-            user_id=str(self.user.id)
+        # The router blocks on the LLM call, so run it outside the shared
+        # database thread to keep other sockets responsive. If another worker
+        # owns this conversation, it processes the turn instead.
+        await database_sync_to_async(message_router.submit_message, thread_sensitive=False)(
+            self.conversation_id,
+            message.id
         )
 
-    async def handle_file_upload(self, data):
+    async def handle_file_upload_start(self, data):
         """
-        Handle file upload request
+        Start a chunked file upload
         """
-        file_data = data.get('file', {})
-        if not file_data:
-            raise ValueError("No file data provided")
+        upload = await self.uploads.start(
+            name=data.get('name', ''),
+            size=int(data.get('size', 0)),
+            content_type=data.get('content_type', ''),
+            kind=data.get('file_type', '')
+        )
+        await self.send_upload_progress(upload)
 
-        # Process file through router
-        await self.channel_layer.send(
-            self.channel_name,
-            {
-                "type": "process_file_upload",
-                "file_data": file_data
-            }
+    async def handle_file_upload_resume(self, data):
+        """
+        Resume an interrupted chunked upload
+        """
+        upload = await self.uploads.resume(data.get('upload_id'))
+        await self.send_upload_progress(upload)
+
+    async def handle_file_chunk(self, data):
+        """
+        Store the next chunk of an upload
+        """
+        upload = await self.uploads.write_chunk(
+            data.get('upload_id'),
+            int(data.get('offset', -1)),
+            data.get('data', b'')
         )
+        await self.send_upload_progress(upload)
+
+        if upload.completed_at:
+            # Only the reference travels through the channel layer
+            await self.channel_layer.send(
+                self.channel_name,
+                {
+                    "type": "process_file_upload",
+                    "upload_id": str(upload.id)
+                }
+            )
+
+    async def send_upload_progress(self, upload):
+        """
+        Tell the client where to continue an upload
+        """
+        await self.send_payload({
+            "type": "file_upload_ack",
+            "upload_id": str(upload.id),
+            "offset": upload.received,
+            "chunk_size": self.uploads.chunk_size,
+            "completed": upload.completed_at is not None,
+            "sha256": upload.sha256 or None
+        })
 
     async def process_file_upload(self, event):
         """
-        Process file upload through router
+        Process a completed upload through router
         """
-        message_router.handle_file_upload(
+        upload = await FileUpload.objects.aget(id=event['upload_id'])
+        await database_sync_to_async(message_router.handle_file_upload, thread_sensitive=False)(
             self.conversation_id,
-            event['file_data']
+            upload.as_reference()
         )
 
     async def handle_file_download(self, data):
         """
-        Handle file download request
+        Handle file download request with a signed link to the file
         """
         file_request = data.get('file_request', {})
         if not file_request:
             raise ValueError("No file request data provided")
 
-        # Get file through router
-        file_data = message_router.handle_file_download(
-            self.conversation_id,
-            file_request
-        )
+        link = None
+        if file_request.get('source') == 'upload':
+            upload = await FileUpload.objects.filter(
+                id=file_request.get('upload_id'),
+                conversation=self.conversation,
+                completed_at__isnull=False
+            ).afirst()
+            if upload:
+                link = await database_sync_to_async(downloads.signed_url, thread_sensitive=False)(
+                    upload.file.name, upload.name, upload.content_type, upload.sha256
+                )
+        else:
+            # Get file through router and cache it for the HTTP download
+            file_data = await database_sync_to_async(message_router.handle_file_download, thread_sensitive=False)(
+                self.conversation_id,
+                file_request
+            )
+            if file_data:
+                link = await database_sync_to_async(downloads.cache_github_file, thread_sensitive=False)(file_data)
 
-        if file_data:
-            await self.send(text_data=json.dumps({
+        if link:
+            await self.send_payload({
                 "type": "file_download",
-                "file": file_data
-            }))
+                "file": link
+            })
         else:
-            await self.send(text_data=json.dumps({
+            await self.send_payload({
                 "type": "error",
                 "message": "File not found or access denied"
-            }))
+            })
 
     async def send_team_status(self):
         """
-        Send initial status for all team members
+        Send a single presence snapshot for all team members
+        """
+        await self.send_payload({
+            "type": "presence",
+            "roles": await presence_service.aget_snapshot()
+        }, coalesce_key="presence")
+
+    async def send_payload(self, payload, coalesce_key=None):
+        """
+        Encode a payload with the negotiated codec and queue it
+        """
+        await self.enqueue(protocol.encode(payload, self.codec), coalesce_key)
+
+    async def send_frames(self, frames, coalesce_key=None):
+        """
+        Queue the pre-encoded frame matching the negotiated codec
+        """
+        await self.enqueue(frames[self.codec], coalesce_key)
+
+    async def enqueue(self, frame, coalesce_key=None):
+        """
+        Queue a frame for the writer task, dropping slow consumers
         """
-        roles = ['cto', 'ux', 'ui', 'dev', 'tester']
-        for role in roles:
-            await self.send(text_data=json.dumps({
-                "type": "status",
-                "role": role,
-                "status": "online"
-            }))
\ No newline at end of file
+        if self.slow_consumer:
+            return
+        if not self.outbound.put(frame, coalesce_key):
+            # The client is not keeping up; it reconnects and resumes from its cursor
+            self.slow_consumer = True
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+
+    async def send_encoded(self, frame):
+        """
+        Send an encoded frame as a binary or text WebSocket frame
+        """
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
@@ -0,0 +1,150 @@
+"""
+Signed, short-lived download links for chat files.
+
+The socket only carries a link; the file itself is served over HTTP by
+``FileDownloadView`` (through nginx ``X-Accel-Redirect`` when configured)
+with ETag and Range support. Files fetched from GitHub are cached in media
+storage under their blob SHA, so a repeated download is only written once;
+every download is still fetched through the router, which checks access.
+The cache is capped at ``CHAT_DOWNLOAD_CACHE_MAX_BYTES``, least recently
+served files first, sparing those whose links may still be live.
+"""
+import base64
+import hashlib
+import os
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+SIGNING_SALT = 'chat.download'
+GITHUB_CACHE_DIR = 'chat_downloads/github'
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# SHA-1 or SHA-256 git object ids
+_BLOB_SHA_RE = re.compile(r'^[0-9a-f]{40}(?:[0-9a-f]{24})?$')
+
+
+def signed_url(name: str, filename: str, content_type: str = '', etag: str = '') -> Dict[str, Any]:
+    """
+    Build a short-lived download link for a file in media storage
+    """
+    token = signing.dumps(
+        {'name': name, 'filename': filename, 'content_type': content_type, 'etag': etag},
+        salt=SIGNING_SALT,
+        compress=True
+    )
+    return {
+        'name': filename,
+        'url': reverse('chat:file_download', args=[token]),
+        'size': default_storage.size(name),
+        'etag': etag,
+        'expires_in': settings.CHAT_DOWNLOAD_URL_TTL,
+    }
+
+
+def load_token(token: str) -> Dict[str, str]:
+    """
+    Verify a download token, raising signing.BadSignature when invalid or expired
+    """
+    return signing.loads(token, salt=SIGNING_SALT, max_age=settings.CHAT_DOWNLOAD_URL_TTL)
+
+
+def cache_github_file(file_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store a file fetched from GitHub under its ETag and sign a link to it
+    """
+    content = file_data.get('content') or b''
+    if file_data.get('encoding') == 'base64':
+        content = base64.b64decode(content)
+    elif isinstance(content, str):
+        content = content.encode('utf-8')
+
+    sha = file_data.get('sha') or ''
+    # The key becomes a storage path, never trust it unchecked
+    etag = sha if _BLOB_SHA_RE.match(sha) else hashlib.sha256(content).hexdigest()
+    name = f"{GITHUB_CACHE_DIR}/{etag}"
+    path = default_storage.path(name)
+    if default_storage.exists(name):
+        # Marks it recently served for eviction
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        _evict_github_cache(os.path.dirname(path))
+
+    filename = os.path.basename(file_data.get('path') or file_data.get('name') or etag)
+    return signed_url(name, filename, file_data.get('content_type', ''), etag)
+
+
+def _evict_github_cache(directory: str) -> None:
+    """
+    Delete the least recently served cached files while the cache is over its cap
+    """
+    entries = []
+    with os.scandir(directory) as scan:
+        for entry in scan:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    # Files served within a link's lifetime may still be downloaded
+    cutoff = time.time() - settings.CHAT_DOWNLOAD_URL_TTL
+    for mtime, size, path in sorted(entries):
+        if total <= settings.CHAT_DOWNLOAD_CACHE_MAX_BYTES or mtime > cutoff:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range into inclusive (start, end) offsets.
+
+    Returns None when the header is absent or not a single byte range, and
+    raises ValueError when the range cannot be satisfied.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def iter_range(fh, start: int, length: int, block_size: int = 64 * 1024):
+    """
+    Yield ``length`` bytes of an open file starting at ``start``
+    """
+    try:
+        fh.seek(start)
+        while length > 0:
+            block = fh.read(min(block_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        fh.close()
@@ -0,0 +1,131 @@
+"""
+Sequenced event log for resumable chat sessions.
+
+Every event broadcast to a conversation gets the next value of a
+per-conversation counter as its ``seq`` and is kept in a short Redis stream.
+A reconnecting client sends ``resume`` with the last ``seq`` it saw and only
+the missed events are replayed. When the gap is older than the buffer the
+client is told to resync and reload the history over HTTP instead.
+"""
+import json
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from . import protocol
+from .redis_client import get_async_redis, get_redis
+
+
+def _seq_key(conversation_id) -> str:
+    return f"chat:seq:{conversation_id}"
+
+
+def _stream_key(conversation_id) -> str:
+    return f"chat:events:{conversation_id}"
+
+
+class EventLog:
+    """
+    Assigns sequence numbers to conversation events and buffers them for replay
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seqs: Dict[str, int] = defaultdict(int)
+        self._events: Dict[str, deque] = {}
+
+    @property
+    def max_events(self) -> int:
+        return settings.CHAT_REPLAY_BUFFER_SIZE
+
+    @property
+    def ttl(self) -> int:
+        return settings.CHAT_REPLAY_TTL
+
+    def event(self, conversation_id, handler: str, payload: Dict[str, Any],
+              coalesce_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Sequence a payload and build its group event
+        """
+        client = get_redis()
+        if client is None:
+            seq = self._append_local(conversation_id, payload)
+        else:
+            seq = client.incr(_seq_key(conversation_id))
+            pipe = client.pipeline()
+            self._add_to_stream(pipe, conversation_id, seq, payload)
+            pipe.execute()
+        return self._group_event(handler, seq, payload, coalesce_key)
+
+    async def aevent(self, conversation_id, handler: str, payload: Dict[str, Any],
+                     coalesce_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Sequence a payload and build its group event from async code
+        """
+        client = get_async_redis()
+        if client is None:
+            seq = self._append_local(conversation_id, payload)
+        else:
+            seq = await client.incr(_seq_key(conversation_id))
+            pipe = client.pipeline()
+            self._add_to_stream(pipe, conversation_id, seq, payload)
+            await pipe.execute()
+        return self._group_event(handler, seq, payload, coalesce_key)
+
+    async def aread_after(self, conversation_id, after_seq: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the payloads sequenced after ``after_seq``.
+
+        Returns None when some of them are no longer buffered.
+        """
+        client = get_async_redis()
+        if client is None:
+            with self._lock:
+                last_seq = self._seqs[str(conversation_id)]
+                payloads = list(self._events.get(str(conversation_id), ()))
+        else:
+            pipe = client.pipeline()
+            pipe.get(_seq_key(conversation_id))
+            pipe.xrange(_stream_key(conversation_id))
+            last_seq, entries = await pipe.execute()
+            last_seq = int(last_seq or 0)
+            payloads = [json.loads(fields['payload']) for _, fields in entries]
+
+        if after_seq >= last_seq:
+            return []
+
+        missed = sorted(
+            (payload for payload in payloads if payload['seq'] > after_seq),
+            key=lambda payload: payload['seq']
+        )
+        if not missed or missed[0]['seq'] != after_seq + 1:
+            return None
+        return missed
+
+    def _append_local(self, conversation_id, payload: Dict[str, Any]) -> int:
+        with self._lock:
+            self._seqs[str(conversation_id)] += 1
+            seq = self._seqs[str(conversation_id)]
+            events = self._events.setdefault(str(conversation_id), deque(maxlen=self.max_events))
+            events.append(dict(payload, seq=seq))
+        return seq
+
+    def _add_to_stream(self, pipe, conversation_id, seq: int, payload: Dict[str, Any]) -> None:
+        stream = _stream_key(conversation_id)
+        pipe.xadd(
+            stream,
+            {'payload': protocol.encode(dict(payload, seq=seq), protocol.JSON)},
+            maxlen=self.max_events,
+            approximate=True
+        )
+        pipe.expire(stream, self.ttl)
+
+    def _group_event(self, handler: str, seq: int, payload: Dict[str, Any],
+                     coalesce_key: Optional[str]) -> Dict[str, Any]:
+        event = protocol.group_event(handler, dict(payload, seq=seq), coalesce_key)
+        event["seq"] = seq
+        return event
+
+
+event_log = EventLog()
@@ -0,0 +1,64 @@
+"""
+Cached conversation list fragments.
+
+The rendered list is stored per (user, chat type) under the user's current
+list version. Writing a message or conversation bumps the version, so stale
+fragments are never read again and simply expire.
+"""
+import time
+from typing import Optional
+
+from django.core.cache import cache
+
+FRAGMENT_TIMEOUT = 60 * 60
+
+
+def _version_key(user_id) -> str:
+    return f"chat:list:version:{user_id}"
+
+
+def _fragment_key(user_id, chat_type: str, version: int) -> str:
+    return f"chat:list:{user_id}:{chat_type}:{version}"
+
+
+def _initial_version() -> int:
+    # Seeded from the clock so an evicted counter never restarts below
+    # the version of a fragment that is still cached
+    return int(time.time() * 1000)
+
+
+async def aget_version(user_id) -> int:
+    """
+    Get the current list version of a user
+    """
+    key = _version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(user_id) -> None:
+    """
+    Invalidate every cached list fragment of a user
+    """
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+
+
+async def aget_fragment(user_id, chat_type: str, version: int) -> Optional[str]:
+    """
+    Get a cached list fragment
+    """
+    return await cache.aget(_fragment_key(user_id, chat_type, version))
+
+
+async def aset_fragment(user_id, chat_type: str, version: int, fragment: str) -> None:
+    """
+    Cache a rendered list fragment
+    """
+    await cache.aset(_fragment_key(user_id, chat_type, version), fragment, FRAGMENT_TIMEOUT)
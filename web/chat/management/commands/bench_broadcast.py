@@ -0,0 +1,65 @@
+"""
+Benchmark the CPU cost of fanning a chat event out to a room
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from web.chat import protocol
+
+
+class Command(BaseCommand):
+    help = 'Measure CPU time per group broadcast for rooms of different sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listeners', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--broadcasts', type=int, default=100)
+        parser.add_argument('--content-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        payload = {
+            'id': 1,
+            'role': 'assistant',
+            'content': 'x' * options['content_size'],
+            'metadata': {'model': 'gpt-4', 'tokens': 128},
+            'created_at': '2024-01-01T00:00:00+00:00',
+        }
+        broadcasts = options['broadcasts']
+
+        self.stdout.write(f"{'listeners':>10} {'per-consumer us':>16} {'encode-once us':>15} {'speedup':>8}")
+        for listeners in options['listeners']:
+            # Half the room on each codec, like a mixed browser/native client base
+            codecs = [protocol.MSGPACK if i % 2 else protocol.JSON for i in range(listeners)]
+
+            per_consumer = self._measure(self._per_consumer, payload, codecs, broadcasts)
+            encode_once = self._measure(self._encode_once, payload, codecs, broadcasts)
+
+            self.stdout.write(
+                f"{listeners:>10} {per_consumer * 1e6:>16.1f} {encode_once * 1e6:>15.1f} "
+                f"{per_consumer / encode_once:>7.1f}x"
+            )
+
+    def _measure(self, fan_out, payload, codecs, broadcasts) -> float:
+        """
+        Get the average CPU seconds spent per broadcast
+        """
+        start = time.process_time()
+        for _ in range(broadcasts):
+            fan_out(payload, codecs)
+        return (time.process_time() - start) / broadcasts
+
+    def _per_consumer(self, payload, codecs) -> None:
+        """
+        Every consumer serializes the event dict itself
+        """
+        for _ in codecs:
+            json.dumps(payload)
+
+    def _encode_once(self, payload, codecs) -> None:
+        """
+        The sender encodes once per codec, consumers only pick their frame
+        """
+        frames = protocol.group_event('chat_message', payload)['frames']
+        for codec in codecs:
+            frames[codec]
@@ -1,165 +1,249 @@
 import asyncio
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from django.conf import settings
+from django.contrib.auth import get_user_model
 
 from ai.conversation_manager import ConversationManager
 from ai.personality_types import AIRole
 from tickets.ticket_manager import TicketManager
 from github.github_client import GitHubClient
 
+from .event_log import event_log
+from .models import Message
+from .presence import presence_service
+from .redis_client import get_redis
+from .submissions import submission_log
+from .turns import turn_queue
+
+User = get_user_model()
+
+
+def _context_key(conversation_id) -> str:
+    return f"chat:context:{conversation_id}"
+
+
 class MessageRouter:
     """
-    Routes messages between the web interface and AI processing system
+    Routes messages between the web interface and AI processing system.
+
+    The router keeps no per-conversation state between calls: history is
+    read from the database and ticket/GitHub context from Redis, so any
+    worker can process any conversation. Turns are serialized per
+    conversation by the turn queue.
     """
     def __init__(self):
         self.channel_layer = get_channel_layer()
         self.conversation_manager = ConversationManager()
         self.ticket_manager = TicketManager()
         self.github_client = GitHubClient()
-        self._conversation_contexts: Dict[str, Dict[str, Any]] = {}
+        # Only used when Redis is not configured (single process)
+        self._local_state: Dict[str, Dict[str, Any]] = {}
 
-    def process_message(self, conversation_id: str, message_content: str, user_id: str) -> None:
+    def submit_message(self, conversation_id: str, message_id: int) -> None:
         """
-        Process incoming message and route it to appropriate handlers
+        Queue a stored user message and process the conversation's turns in order.
+        Turns queued while another worker owns the conversation are processed there.
         """
-        # Get or create conversation context
-        context = self._get_conversation_context(conversation_id)
-        
-        # Update context with new message
-        context['messages'].append({
-            'role': 'user',
-            'content': message_content
-        })
+        turn_queue.submit(
+            conversation_id,
+            message_id,
+            lambda message_ids: self.process_turn(conversation_id, message_ids)
+        )
+
+    def process_turn(self, conversation_id: str, message_ids: List[int]) -> Optional[Dict[str, Any]]:
+        """
+        Process stored user messages as one turn and route the response to
+        appropriate handlers. Consecutive messages are answered together.
+        Returns the AI reply that was sent, or None if processing failed.
+        """
+        messages = list(
+            Message.objects.select_related('conversation').filter(id__in=message_ids).order_by('id')
+        )
+        if not messages:
+            return None
+        last_message = messages[-1]
+        role = last_message.conversation.chat_type
+
+        # Build the context from the stored history up to this turn
+        context = self._get_conversation_context(conversation_id, last_message)
 
         # Process message through AI system
         try:
-            response = self.conversation_manager.process_message(
-                message_content,
-                context=context,
-                user_id=user_id
-            )
+            with presence_service.working(role):
+                response = self.conversation_manager.process_message(
+                    "\n\n".join(message.content for message in messages),
+                    context=context,
+                    user_id=str(last_message.user_id)
+                )
 
             # Handle different types of responses
             if response.get('type') == 'ticket':
-                self._handle_ticket_response(conversation_id, response)
+                reply = self._handle_ticket_response(conversation_id, response, context)
             elif response.get('type') == 'github':
-                self._handle_github_response(conversation_id, response)
+                reply = self._handle_github_response(conversation_id, response, context)
             else:
-                self._handle_standard_response(conversation_id, response)
-
-            # Update conversation context
-            context['messages'].append({
-                'role': response.get('role', 'assistant'),
-                'content': response.get('content', '')
-            })
+                reply = self._handle_standard_response(conversation_id, response)
 
         except Exception as e:
             self._send_error_message(conversation_id, str(e))
+            reply = None
 
-    def _get_conversation_context(self, conversation_id: str) -> Dict[str, Any]:
+        for message in messages:
+            if message.client_id:
+                # Lets a retried submission pick up this reply from any worker
+                submission_log.record_reply(conversation_id, message.client_id, reply)
+        return reply
+
+    def _get_conversation_context(self, conversation_id: str, message: Message) -> Dict[str, Any]:
         """
-        Get or create conversation context
+        Build the conversation context for a turn
         """
-        if conversation_id not in self._conversation_contexts:
-            self._conversation_contexts[conversation_id] = {
-                'messages': [],
-                'current_ticket': None,
-                'github_context': {},
-                'active_roles': set()
-            }
-        return self._conversation_contexts[conversation_id]
+        history = Message.objects.filter(
+            conversation_id=conversation_id,
+            id__lte=message.id
+        ).order_by('-id').values('is_ai', 'content')[:settings.CHAT_CONTEXT_MESSAGES]
 
-    def _handle_ticket_response(self, conversation_id: str, response: Dict[str, Any]) -> None:
+        state = self._load_state(conversation_id)
+        return {
+            'messages': [
+                {'role': 'assistant' if entry['is_ai'] else 'user', 'content': entry['content']}
+                for entry in reversed(history)
+            ],
+            'current_ticket': state.get('current_ticket'),
+            'github_context': state.get('github_context', {}),
+            'active_roles': set()
+        }
+
+    def _load_state(self, conversation_id: str) -> Dict[str, Any]:
+        """
+        Load the ticket and GitHub context of a conversation
+        """
+        client = get_redis()
+        if client is None:
+            return dict(self._local_state.get(str(conversation_id), {}))
+        state = client.get(_context_key(conversation_id))
+        return json.loads(state) if state else {}
+
+    def _save_state(self, conversation_id: str, context: Dict[str, Any]) -> None:
+        """
+        Store the ticket and GitHub context of a conversation
+        """
+        state = {
+            'current_ticket': context.get('current_ticket'),
+            'github_context': context.get('github_context', {}),
+        }
+        client = get_redis()
+        if client is None:
+            self._local_state[str(conversation_id)] = state
+            return
+        client.set(_context_key(conversation_id), json.dumps(state, default=str), ex=settings.CHAT_CONTEXT_TTL)
+
+    def _handle_ticket_response(self, conversation_id: str, response: Dict[str, Any],
+                                context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Handle ticket-related responses
         """
         ticket_data = response.get('ticket_data', {})
-        context = self._conversation_contexts[conversation_id]
-        
+
         # Update ticket in context
         context['current_ticket'] = ticket_data
+        self._save_state(conversation_id, context)
         
         # Send ticket update to websocket
-        self._send_to_websocket(conversation_id, {
-            'type': 'ticket_update',
+        self._send_to_websocket(conversation_id, event_log.event(conversation_id, 'ticket_update', {
+            'type': 'ticket',
             'ticket': ticket_data
-        })
+        }, coalesce_key=f"ticket:{ticket_data.get('id')}"))
 
         # Send AI response message
-        self._send_ai_message(conversation_id, response)
+        return self._send_ai_message(conversation_id, response)
 
-    def _handle_github_response(self, conversation_id: str, response: Dict[str, Any]) -> None:
+    def _handle_github_response(self, conversation_id: str, response: Dict[str, Any],
+                                context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Handle GitHub-related responses
         """
         github_data = response.get('github_data', {})
-        context = self._conversation_contexts[conversation_id]
-        
+
         # Update GitHub context
         context['github_context'].update(github_data)
+        self._save_state(conversation_id, context)
         
         # Send AI response message
-        self._send_ai_message(conversation_id, response)
+        return self._send_ai_message(conversation_id, response)
 
-    def _handle_standard_response(self, conversation_id: str, response: Dict[str, Any]) -> None:
+    def _handle_standard_response(self, conversation_id: str, response: Dict[str, Any]) -> Dict[str, Any]:
         """
         Handle standard AI responses
         """
-        self._send_ai_message(conversation_id, response)
+        return self._send_ai_message(conversation_id, response)
 
-    def _send_ai_message(self, conversation_id: str, response: Dict[str, Any]) -> None:
+    def _send_ai_message(self, conversation_id: str, response: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Send AI message to websocket
+        Store the AI message and send it to websocket
         """
-        message_data = {
-            'type': 'chat_message',
-            'message': {
-                'role': response.get('role', 'assistant'),
-                'content': response.get('content', ''),
-                'metadata': response.get('metadata', {}),
-            }
+        role = response.get('role', 'assistant')
+
+        # Stored so the next turn's context can be rebuilt on any worker
+        ai_user, _ = User.objects.get_or_create(
+            username=f'ai_{role}',
+            defaults={'email': f'ai_{role}@example.com'}
+        )
+        ai_message = Message.objects.create(
+            conversation_id=conversation_id,
+            user=ai_user,
+            content=response.get('content', ''),
+            is_ai=True
+        )
+
+        message = {
+            'id': ai_message.id,
+            'role': role,
+            'content': ai_message.content,
+            'created_at': ai_message.created_at.isoformat(),
+            'metadata': response.get('metadata', {}),
         }
 
         if response.get('ticket_id'):
-            message_data['message']['ticket_id'] = response['ticket_id']
+            message['ticket_id'] = response['ticket_id']
 
-        self._send_to_websocket(conversation_id, message_data)
+        event = event_log.event(conversation_id, 'chat_message', message)
+        self._send_to_websocket(conversation_id, event)
+        return dict(message, seq=event['seq'])
 
     def _send_error_message(self, conversation_id: str, error_message: str) -> None:
         """
         Send error message to websocket
         """
-        self._send_to_websocket(conversation_id, {
-            'type': 'chat_message',
-            'message': {
-                'role': 'system',
-                'content': f"Error: {error_message}",
-                'metadata': {'error': True}
-            }
-        })
+        self._send_to_websocket(conversation_id, event_log.event(conversation_id, 'chat_message', {
+            'role': 'system',
+            'content': f"Error: {error_message}",
+            'metadata': {'error': True}
+        }))
 
     def _send_to_websocket(self, conversation_id: str, message: Dict[str, Any]) -> None:
         """
-        Send message to websocket group
+        Send a pre-encoded event to the websocket group
         """
         async_to_sync(self.channel_layer.group_send)(
             f"chat_{conversation_id}",
             message
         )
 
-    def handle_file_upload(self, conversation_id: str, file_data: Dict[str, Any]) -> None:
+    def handle_file_upload(self, conversation_id: str, file_ref: Dict[str, Any]) -> None:
         """
-        Handle file uploads and route to appropriate processors
+        Handle file uploads and route to appropriate processors.
+        ``file_ref`` points at the stored file; processors read it from media storage.
         """
         try:
             # Process file through appropriate handler
-            if file_data.get('type') == 'code':
-                response = self.github_client.process_file(file_data)
+            if file_ref.get('type') == 'code':
+                response = self.github_client.process_file(file_ref)
             else:
-                response = self.conversation_manager.process_file(file_data)
+                response = self.conversation_manager.process_file(file_ref)
 
             # Send response
             self._handle_standard_response(conversation_id, response)
@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.conf import settings
 
@@ -43,10 +44,65 @@ class Message(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_ai = models.BooleanField(default=False)
+    # Idempotency key generated by the client, so retried submissions are not stored twice
+    client_id = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
         ordering = ['created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversation', 'client_id'],
+                condition=models.Q(client_id__isnull=False),
+                name='unique_message_client_id'
+            ),
+        ]
+        indexes = [
+            # Keyset pagination of a conversation's history
+            models.Index(fields=['conversation', 'id'], name='chat_message_history_idx'),
+        ]
 
     def __str__(self):
         truncated_content = self.content[:50] + "..." if len(self.content) > 50 else self.content
-        return f"{self.user.username}: {truncated_content}"
\ No newline at end of file
+        return f"{self.user.username}: {truncated_content}"
+
+class FileUpload(models.Model):
+    """
+    Model representing a file uploaded to a conversation in chunks.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='uploads'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='chat_uploads'
+    )
+    file = models.FileField(upload_to='chat_uploads/')
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    kind = models.CharField(max_length=20, blank=True)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.received}/{self.size} bytes)"
+
+    def as_reference(self):
+        """
+        Get the reference passed around instead of the file content.
+        """
+        return {
+            'id': str(self.id),
+            'name': self.name,
+            'type': self.kind,
+            'content_type': self.content_type,
+            'size': self.size,
+            'sha256': self.sha256,
+            'path': self.file.name,
+        }
@@ -0,0 +1,131 @@
+"""
+Per-connection outbound queues for chat WebSockets.
+
+Every frame for a socket goes through a bounded queue drained by a single
+writer task. Frames that carry a coalesce key (role status, ticket state)
+replace any pending frame with the same key, so a slow reader only gets the
+latest version. When the queue is full the connection is treated as a slow
+consumer and closed; the client reconnects and resumes from its cursor.
+"""
+import asyncio
+import itertools
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from django.conf import settings
+
+# Close code sent to slow consumers (4000-4999 is reserved for applications)
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+
+class OutboundMetrics:
+    """
+    Process-wide counters for outbound queues
+    """
+    def __init__(self):
+        self.open_queues = 0
+        self.queued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.slow_consumers = 0
+        self.max_depth = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        Get the current counter values
+        """
+        return {
+            'open_queues': self.open_queues,
+            'queued': self.queued,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'slow_consumers': self.slow_consumers,
+            'max_depth': self.max_depth,
+        }
+
+
+outbound_metrics = OutboundMetrics()
+
+
+def channel_metrics() -> Dict[str, Any]:
+    """
+    Get the channel layer limits and this process's outbound queue counters
+    """
+    config = settings.CHANNEL_LAYERS['default'].get('CONFIG', {})
+    return {
+        'capacity': config.get('capacity'),
+        'expiry': config.get('expiry'),
+        'group_expiry': config.get('group_expiry'),
+        'outbound_queue_size': settings.CHAT_OUTBOUND_QUEUE_SIZE,
+        'outbound': outbound_metrics.snapshot(),
+    }
+
+
+class OutboundQueue:
+    """
+    Bounded send queue with coalescing of superseded frames
+    """
+    def __init__(self, send: Callable[[Any], Awaitable[None]], max_size: int = 256):
+        self._send = send
+        self.max_size = max_size
+        self._pending: "OrderedDict[Any, Any]" = OrderedDict()
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        """
+        Start the writer task
+        """
+        if self._task is None:
+            outbound_metrics.open_queues += 1
+            self._task = asyncio.create_task(self._drain())
+
+    async def stop(self) -> None:
+        """
+        Stop the writer task and drop anything still pending
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._pending.clear()
+        outbound_metrics.open_queues -= 1
+
+    def put(self, frame: Any, coalesce_key: Optional[str] = None) -> bool:
+        """
+        Queue a frame, returning False if the queue is full
+        """
+        if coalesce_key is not None and coalesce_key in self._pending:
+            # Superseded: drop the stale frame and queue the new one last
+            del self._pending[coalesce_key]
+            outbound_metrics.coalesced += 1
+        elif len(self._pending) >= self.max_size:
+            outbound_metrics.slow_consumers += 1
+            return False
+
+        key = coalesce_key if coalesce_key is not None else next(self._counter)
+        self._pending[key] = frame
+        outbound_metrics.queued += 1
+        outbound_metrics.max_depth = max(outbound_metrics.max_depth, len(self._pending))
+        self._wakeup.set()
+        return True
+
+    async def _drain(self) -> None:
+        """
+        Write queued frames in order, waiting for the socket each time
+        """
+        while True:
+            await self._wakeup.wait()
+            while self._pending:
+                _, frame = self._pending.popitem(last=False)
+                await self._send(frame)
+                outbound_metrics.sent += 1
+            self._wakeup.clear()
@@ -0,0 +1,192 @@
+"""
+Presence tracking for the AI team roles.
+
+Role state lives in Redis so every worker shares it, with a short-lived
+in-process copy for snapshots. Changes are pushed to connected sockets as
+single ``status`` deltas, and only when a role's state actually changes.
+
+A busy role is backed by one expiring entry per worker that is dispatching
+for it, refreshed by a heartbeat, so a role whose workers died shows idle
+in snapshots once their entries expire instead of staying busy for good.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from . import protocol
+from .redis_client import get_async_redis, get_redis
+
+ROLES = ('cto', 'ux', 'ui', 'dev', 'tester')
+
+IDLE = 'idle'
+THINKING = 'thinking'
+STATES = (IDLE, THINKING)
+
+PRESENCE_GROUP = 'presence'
+STATE_KEY = 'chat:presence'
+
+
+def _workers_key(role: str) -> str:
+    # Sorted set of worker id -> expiry timestamp
+    return f"chat:presence:workers:{role}"
+
+
+class PresenceService:
+    """
+    Tracks what each AI role is currently doing
+    """
+    def __init__(self, cache_ttl: float = 2.0, worker_ttl: float = 30.0):
+        self.cache_ttl = cache_ttl
+        self.worker_ttl = worker_ttl
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._states: Dict[str, str] = {role: IDLE for role in ROLES}
+        self._guard = threading.Lock()
+        # In-flight dispatches per role in this worker
+        self._active: Dict[str, int] = {role: 0 for role in ROLES}
+        self._heartbeats: Dict[str, threading.Event] = {}
+        self._loaded_at = 0.0
+
+    def get_snapshot(self) -> Dict[str, str]:
+        """
+        Get the state of every role
+        """
+        client = get_redis()
+        if client is not None and self._is_stale():
+            pipe = client.pipeline()
+            self._queue_snapshot(pipe)
+            self._store_snapshot(*pipe.execute())
+        return dict(self._states)
+
+    async def aget_snapshot(self) -> Dict[str, str]:
+        """
+        Get the state of every role from async code
+        """
+        client = get_async_redis()
+        if client is not None and self._is_stale():
+            pipe = client.pipeline()
+            self._queue_snapshot(pipe)
+            self._store_snapshot(*await pipe.execute())
+        return dict(self._states)
+
+    def set_state(self, role: str, state: str) -> bool:
+        """
+        Set a role's state, pushing a delta if it changed
+        """
+        if role not in ROLES:
+            raise ValueError(f"Unknown role: {role}")
+        if state not in STATES:
+            raise ValueError(f"Unknown state: {state}")
+
+        client = get_redis()
+        if client is not None:
+            pipe = client.pipeline()
+            pipe.hget(STATE_KEY, role)
+            pipe.hset(STATE_KEY, role, state)
+            previous = pipe.execute()[0] or IDLE
+        else:
+            previous = self._states[role]
+
+        self._states[role] = state
+        if previous == state:
+            return False
+
+        self._broadcast(role, state)
+        return True
+
+    @contextmanager
+    def working(self, role: str, state: str = THINKING):
+        """
+        Mark a role busy for the duration of an LLM dispatch.
+
+        Overlapping dispatches for the same role, in this worker or others,
+        are counted, so the role only goes back to idle when the last one
+        finishes.
+        """
+        if self._enter(role):
+            self.set_state(role, state)
+        try:
+            yield
+        finally:
+            if self._leave(role):
+                self.set_state(role, IDLE)
+
+    def _enter(self, role: str) -> bool:
+        """
+        Count a dispatch, returning True if it is this worker's first for the role
+        """
+        with self._guard:
+            self._active[role] += 1
+            if self._active[role] > 1:
+                return False
+            stop = self._heartbeats[role] = threading.Event()
+
+        client = get_redis()
+        if client is not None:
+            client.zadd(_workers_key(role), {self.worker_id: time.time() + self.worker_ttl})
+            threading.Thread(target=self._heartbeat, args=(client, role, stop), daemon=True).start()
+        return True
+
+    def _leave(self, role: str) -> bool:
+        """
+        Uncount a dispatch, returning True if no worker is dispatching for the role any more
+        """
+        with self._guard:
+            self._active[role] -= 1
+            if self._active[role] > 0:
+                return False
+            self._heartbeats.pop(role).set()
+
+        client = get_redis()
+        if client is None:
+            return True
+        key = _workers_key(role)
+        pipe = client.pipeline()
+        pipe.zrem(key, self.worker_id)
+        pipe.zremrangebyscore(key, '-inf', time.time())
+        pipe.zcard(key)
+        return pipe.execute()[-1] == 0
+
+    def _heartbeat(self, client, role: str, stop: threading.Event) -> None:
+        while not stop.wait(self.worker_ttl / 3):
+            # xx: never re-adds the entry once the last dispatch removed it
+            client.zadd(_workers_key(role), {self.worker_id: time.time() + self.worker_ttl}, xx=True)
+
+    def _is_stale(self) -> bool:
+        return time.monotonic() - self._loaded_at > self.cache_ttl
+
+    def _queue_snapshot(self, pipe) -> None:
+        pipe.hgetall(STATE_KEY)
+        now = time.time()
+        for role in ROLES:
+            pipe.zcount(_workers_key(role), now, '+inf')
+
+    def _store_snapshot(self, states: Dict[str, str], *live_workers: int) -> None:
+        # A busy state without a live worker was left by a worker that died
+        self._states = {
+            role: states.get(role, IDLE) if workers else IDLE
+            for role, workers in zip(ROLES, live_workers)
+        }
+        self._loaded_at = time.monotonic()
+
+    def _broadcast(self, role: str, state: str) -> None:
+        """
+        Push a single role delta to every connected socket
+        """
+        async_to_sync(get_channel_layer().group_send)(
+            PRESENCE_GROUP,
+            protocol.group_event('team_status', {
+                'type': 'status',
+                'role': role,
+                'status': state
+            }, coalesce_key=f"status:{role}")
+        )
+
+
+presence_service = PresenceService()
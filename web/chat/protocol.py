@@ -0,0 +1,79 @@
+"""
+Wire protocol for chat WebSocket frames.
+
+Clients may negotiate a WebSocket subprotocol to pick the frame encoding.
+``chat.msgpack.v1`` sends msgpack-encoded binary frames, ``chat.json.v1``
+(or no subprotocol at all) keeps the JSON text frames.
+"""
+import json
+from typing import Any, Dict, Optional, Sequence
+
+import msgpack
+
+JSON_SUBPROTOCOL = 'chat.json.v1'
+MSGPACK_SUBPROTOCOL = 'chat.msgpack.v1'
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+SUBPROTOCOL_CODECS = {
+    MSGPACK_SUBPROTOCOL: MSGPACK,
+    JSON_SUBPROTOCOL: JSON,
+}
+
+
+def negotiate_subprotocol(offered: Sequence[str]) -> Optional[str]:
+    """
+    Pick the subprotocol to accept from the ones offered by the client
+    """
+    for subprotocol in (MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL):
+        if subprotocol in offered:
+            return subprotocol
+    return None
+
+
+def codec_for(subprotocol: Optional[str]) -> str:
+    """
+    Get the codec name for an accepted subprotocol
+    """
+    return SUBPROTOCOL_CODECS.get(subprotocol, JSON)
+
+
+def encode(payload: Dict[str, Any], codec: str):
+    """
+    Encode a payload with a single codec
+    """
+    if codec == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True, default=str)
+    return json.dumps(payload, separators=(',', ':'), default=str)
+
+
+def encode_frames(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Encode a payload once for every codec, ready for a group broadcast
+    """
+    return {codec: encode(payload, codec) for codec in (JSON, MSGPACK)}
+
+
+def group_event(handler: str, payload: Dict[str, Any], coalesce_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build a channel layer event whose payload is already encoded.
+
+    Consumers only pick the frame for their codec and write it, so a
+    broadcast costs one encode per codec regardless of the room size.
+    Events sharing a coalesce key supersede each other in a slow
+    consumer's outbound queue.
+    """
+    event = {"type": handler, "frames": encode_frames(payload)}
+    if coalesce_key is not None:
+        event["coalesce"] = coalesce_key
+    return event
+
+
+def decode(text_data: Optional[str] = None, bytes_data: Optional[bytes] = None) -> Dict[str, Any]:
+    """
+    Decode an incoming frame
+    """
+    if bytes_data is not None:
+        return msgpack.unpackb(bytes_data, raw=False)
+    return json.loads(text_data)
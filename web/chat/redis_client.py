@@ -0,0 +1,43 @@
+"""
+Shared Redis connections for chat services.
+
+Services fall back to in-process state when ``CHAT_REDIS_URL`` is not set,
+which keeps single-process development and tests free of a Redis server.
+"""
+import asyncio
+import weakref
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+_sync_client: Optional[redis.Redis] = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """
+    Get the shared synchronous client, None when Redis is not configured
+    """
+    global _sync_client
+    url = getattr(settings, 'CHAT_REDIS_URL', None)
+    if not url:
+        return None
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(url, decode_responses=True)
+    return _sync_client
+
+
+def get_async_redis() -> Optional[aioredis.Redis]:
+    """
+    Get an asyncio client bound to the running event loop
+    """
+    url = getattr(settings, 'CHAT_REDIS_URL', None)
+    if not url:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = aioredis.Redis.from_url(url, decode_responses=True)
+    return client
@@ -9,7 +9,7 @@ class MessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Message
-        fields = ['id', 'content', 'created_at', 'is_ai', 'username']
+        fields = ['id', 'content', 'created_at', 'is_ai', 'username', 'client_id']
         read_only_fields = ['created_at', 'user']
 
 class ConversationSerializer(serializers.ModelSerializer):
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import list_cache
+from .models import Conversation, Message
+
+
+@receiver([post_save, post_delete], sender=Conversation)
+def invalidate_list_on_conversation_write(sender, instance, **kwargs):
+    """
+    Invalidate the owner's cached conversation lists
+    """
+    list_cache.bump_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Message)
+def invalidate_list_on_message_write(sender, instance, **kwargs):
+    """
+    Invalidate the cached conversation lists showing this message
+    """
+    if Message.conversation.is_cached(instance):
+        user_id = instance.conversation.user_id
+    else:
+        user_id = Conversation.objects.filter(
+            id=instance.conversation_id
+        ).values_list('user_id', flat=True).first()
+
+    if user_id is not None:
+        list_cache.bump_version(user_id)
@@ -0,0 +1,141 @@
+"""
+Idempotent message submission for chat sockets.
+
+Clients tag every ``message`` frame with a ``client_id`` and resend it
+unchanged when a connection drops before the ack arrives. The first frame
+claims the id in Redis (``SET NX`` with a short TTL) and the claim records the
+stored message and, once the router answers, its AI reply. A retry finds the
+claim and gets that state back instead of storing the message again and
+starting another completion. The unique ``(conversation, client_id)``
+constraint on ``Message`` backs this up once the claim has expired.
+"""
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from .redis_client import get_async_redis, get_redis
+
+PENDING = 'pending'
+COMPLETED = 'completed'
+FAILED = 'failed'
+EXPIRED = 'expired'
+
+
+def _claim_key(conversation_id, client_id: str) -> str:
+    return f"chat:submit:{conversation_id}:{client_id}"
+
+
+class SubmissionLog:
+    """
+    Tracks recently submitted messages by their client-generated ID
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    @property
+    def ttl(self) -> int:
+        return settings.CHAT_SUBMISSION_TTL
+
+    async def aclaim(self, conversation_id, client_id: str) -> bool:
+        """
+        Claim a client ID, returning False if it was already submitted
+        """
+        if not client_id or len(client_id) > 64:
+            raise ValueError("client_id must be 1-64 characters")
+
+        state = {'status': PENDING, 'message_id': None, 'reply': None}
+        key = _claim_key(conversation_id, client_id)
+        client = get_async_redis()
+        if client is not None:
+            return bool(await client.set(key, json.dumps(state), nx=True, ex=self.ttl))
+
+        with self._lock:
+            self._expire_local()
+            if key in self._local:
+                return False
+            self._local[key] = (time.monotonic() + self.ttl, state)
+        return True
+
+    async def aget(self, conversation_id, client_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the recorded state of a submission
+        """
+        key = _claim_key(conversation_id, client_id)
+        client = get_async_redis()
+        if client is not None:
+            state = await client.get(key)
+            return json.loads(state) if state else None
+
+        with self._lock:
+            self._expire_local()
+            entry = self._local.get(key)
+            return dict(entry[1]) if entry else None
+
+    async def arecord_message(self, conversation_id, client_id: str, message_id: int) -> None:
+        """
+        Record the stored message for a claimed submission
+        """
+        await self._aupdate(conversation_id, client_id, message_id=message_id)
+
+    def record_reply(self, conversation_id, client_id: str, reply: Optional[Dict[str, Any]]) -> None:
+        """
+        Record the AI reply for a submission, or that producing it failed.
+        Called by the router from whichever worker processed the turn.
+        """
+        changes = {'status': COMPLETED if reply else FAILED, 'reply': reply}
+        key = _claim_key(conversation_id, client_id)
+        client = get_redis()
+        if client is not None:
+            state = client.get(key)
+            if state:
+                client.set(key, self._merge(state, changes), keepttl=True)
+            return
+        self._update_local(key, changes)
+
+    async def arelease(self, conversation_id, client_id: str) -> None:
+        """
+        Drop a claim whose message could not be stored, so a retry can go through
+        """
+        key = _claim_key(conversation_id, client_id)
+        client = get_async_redis()
+        if client is not None:
+            await client.delete(key)
+            return
+
+        with self._lock:
+            self._local.pop(key, None)
+
+    async def _aupdate(self, conversation_id, client_id: str, **changes) -> None:
+        key = _claim_key(conversation_id, client_id)
+        client = get_async_redis()
+        if client is not None:
+            state = await client.get(key)
+            if state:
+                await client.set(key, self._merge(state, changes), keepttl=True)
+            return
+        self._update_local(key, changes)
+
+    def _merge(self, state: str, changes: Dict[str, Any]) -> str:
+        # Expired claims are not recreated, the unique constraint covers
+        # retries from then on; callers keep the claim's expiry
+        state = json.loads(state)
+        state.update(changes)
+        return json.dumps(state, default=str)
+
+    def _update_local(self, key: str, changes: Dict[str, Any]) -> None:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                entry[1].update(changes)
+
+    def _expire_local(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._local.items() if expires_at <= now]:
+            del self._local[key]
+
+
+submission_log = SubmissionLog()
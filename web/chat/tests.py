@@ -1,8 +1,26 @@
-from django.test import TestCase, override_settings
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from io import StringIO
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
+from . import outbound, presence, protocol
+from .downloads import GITHUB_CACHE_DIR, cache_github_file, signed_url
+from .event_log import EventLog
+from .submissions import COMPLETED, PENDING, SubmissionLog
+from .turns import TurnQueue
+from .uploads import UploadSession
 from .models import Conversation, Message
 
 User = get_user_model()
@@ -102,6 +120,75 @@ class ConversationTests(APITestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['content'], 'Test message')
 
+    def test_list_messages_after_cursor(self):
+        """Test resuming the message list after a cursor"""
+        newer = Message.objects.create(
+            conversation=self.conversation,
+            user=self.user,
+            content='Newer message',
+            is_ai=False
+        )
+        url = reverse('chat_api:conversation-messages', args=[self.conversation.id])
+        response = self.client.get(url, {'after': self.message.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['id'] for m in response.data], [newer.id])
+
+    def test_list_messages_invalid_cursor(self):
+        """Test a non-integer cursor is rejected instead of failing the query"""
+        url = reverse('chat_api:conversation-messages', args=[self.conversation.id])
+        for param, value in (('after', 'abc'), ('before', 'abc'), ('limit', 'abc'),
+                             ('after', -1), ('before', -1), ('limit', 0), ('limit', -1)):
+            response = self.client.get(url, {param: value})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(param, response.data)
+
+    @override_settings(CHAT_HISTORY_PAGE_SIZE=2)
+    def test_list_messages_before_cursor(self):
+        """Test paging back through history with a keyset cursor and ETags"""
+        newer = [
+            Message.objects.create(conversation=self.conversation, user=self.user, content=f'Message {i}')
+            for i in range(3)
+        ]
+        url = reverse('chat_api:conversation-messages', args=[self.conversation.id])
+        response = self.client.get(url, {'before': newer[-1].id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['id'] for m in response.data], [newer[0].id, newer[1].id])
+        self.assertIn('max-age', response['Cache-Control'])
+
+        response = self.client.get(url, {'before': newer[-1].id}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(url, {'before': newer[0].id, 'limit': 10})
+        self.assertEqual([m['id'] for m in response.data], [self.message.id])
+
+    def test_send_message_retry(self):
+        """Test a retried message with the same client_id is stored once"""
+        url = reverse('chat_api:conversation-send-message', args=[self.conversation.id])
+        data = {'content': 'New message', 'client_id': 'abc-1'}
+        first = self.client.post(url, data, format='json')
+        retry = self.client.post(url, data, format='json')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Message.objects.filter(client_id='abc-1').count(), 1)
+
+    def test_send_message_concurrent_retry(self):
+        """Test a retry that loses the insert race returns the stored message"""
+        url = reverse('chat_api:conversation-send-message', args=[self.conversation.id])
+        stored = Message.objects.create(
+            conversation=self.conversation, user=self.user, content='New message', client_id='abc-2'
+        )
+        # The other request inserts between this one's check and its insert
+        missed = mock.Mock(first=mock.Mock(return_value=None))
+        with mock.patch.object(Message.objects, 'filter', return_value=missed):
+            response = self.client.post(url, {'content': 'New message', 'client_id': 'abc-2'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], stored.id)
+
     def test_unauthorized_access(self):
         """Test unauthorized access to conversations"""
         self.client.force_authenticate(user=None)
@@ -110,6 +197,66 @@ class ConversationTests(APITestCase):
         
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+@override_settings(
+    SECRET_KEY='django-insecure-test-key-123',
+    MIDDLEWARE=[
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    ]
+)
+class ChatListViewTests(TestCase):
+    def setUp(self):
+        """Set up a user with one conversation"""
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_login(self.user)
+        self.conversation = Conversation.objects.create(user=self.user, title='Test Conversation')
+        Message.objects.create(conversation=self.conversation, user=self.user, content='First message')
+
+    def test_list_is_cached_until_a_message_is_written(self):
+        """Test the rendered list is reused and refreshed on new messages"""
+        url = reverse('chat:list')
+        self.assertContains(self.client.get(url), 'First message')
+
+        with mock.patch('web.chat.views.render_to_string') as render_list:
+            self.client.get(url)
+        render_list.assert_not_called()
+
+        Message.objects.create(conversation=self.conversation, user=self.user, content='Second message')
+        self.assertContains(self.client.get(url), 'Second message')
+
+    def test_post_queues_reply(self):
+        """Test posting returns immediately and hands the reply to the worker"""
+        channel_layer = mock.Mock(send=mock.AsyncMock())
+        with mock.patch('web.chat.views.get_channel_layer', return_value=channel_layer):
+            response = self.client.post(
+                reverse('chat:list') + '?type=dev',
+                {'message': 'Hello'},
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+            )
+
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        message = Message.objects.get(conversation_id=data['conversation_id'])
+        self.assertEqual(message.content, 'Hello')
+        channel_layer.send.assert_awaited_once_with('chat-replies', {
+            'type': 'generate_reply',
+            'message_id': message.id
+        })
+
+    @override_settings(CHAT_HISTORY_PAGE_SIZE=2)
+    def test_room_renders_latest_window(self):
+        """Test the room only renders the newest messages"""
+        for i in range(3):
+            Message.objects.create(conversation=self.conversation, user=self.user, content=f'Message {i}')
+        response = self.client.get(reverse('chat:chat_room', args=[self.conversation.id]))
+
+        self.assertEqual([m.content for m in response.context['messages']], ['Message 1', 'Message 2'])
+        self.assertTrue(response.context['has_older_messages'])
+        self.assertNotContains(response, 'First message')
+
 @override_settings(SECRET_KEY='django-insecure-test-key-123')
 class ConversationModelTests(TestCase):
     def setUp(self):
@@ -171,4 +318,342 @@ class ConversationModelTests(TestCase):
         )
         messages = Message.objects.all()
         self.assertEqual(messages[0], message1)
-        self.assertEqual(messages[1], message2)
\ No newline at end of file
+        self.assertEqual(messages[1], message2)
+
+class ProtocolTests(SimpleTestCase):
+    def test_negotiate_prefers_msgpack(self):
+        """Test msgpack is picked when the client offers it"""
+        offered = [protocol.JSON_SUBPROTOCOL, protocol.MSGPACK_SUBPROTOCOL]
+        subprotocol = protocol.negotiate_subprotocol(offered)
+        self.assertEqual(subprotocol, protocol.MSGPACK_SUBPROTOCOL)
+        self.assertEqual(protocol.codec_for(subprotocol), protocol.MSGPACK)
+
+    def test_negotiate_falls_back_to_json(self):
+        """Test clients without a known subprotocol get JSON frames"""
+        self.assertIsNone(protocol.negotiate_subprotocol(['other']))
+        self.assertEqual(protocol.codec_for(None), protocol.JSON)
+
+    def test_encode_frames_round_trip(self):
+        """Test every pre-encoded frame decodes to the same payload"""
+        payload = {'type': 'status', 'role': 'cto', 'status': 'idle'}
+        frames = protocol.encode_frames(payload)
+        self.assertEqual(protocol.decode(text_data=frames[protocol.JSON]), payload)
+        self.assertEqual(protocol.decode(bytes_data=frames[protocol.MSGPACK]), payload)
+
+    def test_group_event_carries_frames(self):
+        """Test group events carry a frame for every codec"""
+        event = protocol.group_event('ticket_update', {'type': 'ticket', 'ticket': {'id': '1'}})
+        self.assertEqual(event['type'], 'ticket_update')
+        self.assertEqual(set(event['frames']), {protocol.JSON, protocol.MSGPACK})
+
+    def test_bench_broadcast_command(self):
+        """Test the broadcast benchmark reports one row per room size"""
+        out = StringIO()
+        call_command('bench_broadcast', listeners=[2, 4], broadcasts=1, stdout=out)
+        self.assertEqual(len(out.getvalue().strip().splitlines()), 3)
+
+class PresenceTests(SimpleTestCase):
+    def setUp(self):
+        """Set up an in-process presence service"""
+        self.service = presence.PresenceService()
+        patcher = mock.patch.object(self.service, '_broadcast')
+        self.broadcast = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_snapshot_starts_idle(self):
+        """Test every role starts idle"""
+        snapshot = self.service.get_snapshot()
+        self.assertEqual(set(snapshot), set(presence.ROLES))
+        self.assertTrue(all(state == presence.IDLE for state in snapshot.values()))
+
+    def test_deltas_only_on_change(self):
+        """Test a delta is pushed only when the state changes"""
+        self.assertTrue(self.service.set_state('cto', presence.THINKING))
+        self.assertFalse(self.service.set_state('cto', presence.THINKING))
+        self.broadcast.assert_called_once_with('cto', presence.THINKING)
+
+    def test_overlapping_dispatches(self):
+        """Test a role stays busy until its last dispatch finishes"""
+        with self.service.working('dev'):
+            with self.service.working('dev'):
+                self.assertEqual(self.service.get_snapshot()['dev'], presence.THINKING)
+            self.assertEqual(self.service.get_snapshot()['dev'], presence.THINKING)
+        self.assertEqual(self.service.get_snapshot()['dev'], presence.IDLE)
+        self.assertEqual(self.broadcast.call_count, 2)
+
+class OutboundQueueTests(SimpleTestCase):
+    def test_coalesces_superseded_frames(self):
+        """Test a newer frame with the same key replaces the pending one"""
+        queue = outbound.OutboundQueue(send=None, max_size=10)
+        queue.put('status idle', 'status:cto')
+        queue.put('message')
+        queue.put('status thinking', 'status:cto')
+        self.assertEqual(list(queue._pending.values()), ['message', 'status thinking'])
+
+    def test_rejects_when_full(self):
+        """Test a full queue reports a slow consumer"""
+        queue = outbound.OutboundQueue(send=None, max_size=2)
+        self.assertTrue(queue.put('one'))
+        self.assertTrue(queue.put('two'))
+        self.assertFalse(queue.put('three'))
+        self.assertFalse(queue.put('status', 'status:cto'))
+
+    async def test_writer_sends_in_order(self):
+        """Test the writer task drains frames in queue order"""
+        sent = []
+
+        async def send(frame):
+            sent.append(frame)
+
+        queue = outbound.OutboundQueue(send=send)
+        queue.start()
+        queue.put('one')
+        queue.put('two')
+        await asyncio.sleep(0)
+        await queue.stop()
+        self.assertEqual(sent, ['one', 'two'])
+
+@override_settings(
+    SECRET_KEY='django-insecure-test-key-123',
+    MIDDLEWARE=[
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+    ]
+)
+class ChannelMetricsTests(APITestCase):
+    def test_staff_only(self):
+        """Test the channel metrics are served to staff and nobody else"""
+        url = reverse('chat_api:channel_metrics')
+        self.client.force_authenticate(User.objects.create_user(username='member', password='testpass123'))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create_user(username='ops', password='testpass123', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['outbound_queue_size'], settings.CHAT_OUTBOUND_QUEUE_SIZE)
+        self.assertEqual(set(response.data['outbound']), set(outbound.outbound_metrics.snapshot()))
+
+@override_settings(CHAT_REPLAY_BUFFER_SIZE=3)
+class EventLogTests(SimpleTestCase):
+    def setUp(self):
+        """Set up an in-process event log with a few events"""
+        self.log = EventLog()
+        for i in range(5):
+            self.event = self.log.event('1', 'chat_message', {'content': f'message {i}'})
+
+    def test_events_are_sequenced(self):
+        """Test events carry monotonic sequence numbers"""
+        self.assertEqual(self.event['seq'], 5)
+        self.assertEqual(protocol.decode(text_data=self.event['frames'][protocol.JSON])['seq'], 5)
+
+    async def test_replays_missed_events(self):
+        """Test only the events after the cursor are replayed"""
+        missed = await self.log.aread_after('1', 3)
+        self.assertEqual([payload['seq'] for payload in missed], [4, 5])
+        self.assertEqual(await self.log.aread_after('1', 5), [])
+
+    async def test_gap_too_large(self):
+        """Test a resync is needed once the gap leaves the buffer"""
+        self.assertIsNone(await self.log.aread_after('1', 1))
+
+class SubmissionLogTests(SimpleTestCase):
+    def setUp(self):
+        """Set up an in-process submission log"""
+        self.log = SubmissionLog()
+
+    async def test_claim_once(self):
+        """Test a client ID can only be claimed once"""
+        self.assertTrue(await self.log.aclaim('1', 'abc'))
+        self.assertFalse(await self.log.aclaim('1', 'abc'))
+        self.assertTrue(await self.log.aclaim('2', 'abc'))
+
+    async def test_records_message_and_reply(self):
+        """Test a retry sees the stored message and the AI reply"""
+        await self.log.aclaim('1', 'abc')
+        await self.log.arecord_message('1', 'abc', 7)
+        self.assertEqual((await self.log.aget('1', 'abc'))['status'], PENDING)
+
+        self.log.record_reply('1', 'abc', {'content': 'Hi', 'seq': 2})
+        state = await self.log.aget('1', 'abc')
+        self.assertEqual(state['message_id'], 7)
+        self.assertEqual(state['status'], COMPLETED)
+        self.assertEqual(state['reply']['content'], 'Hi')
+
+    async def test_release(self):
+        """Test a released claim can be taken again"""
+        await self.log.aclaim('1', 'abc')
+        await self.log.arelease('1', 'abc')
+        self.assertTrue(await self.log.aclaim('1', 'abc'))
+
+class TurnQueueTests(SimpleTestCase):
+    def setUp(self):
+        """Set up an in-process turn queue"""
+        self.queue = TurnQueue()
+        self.processed = []
+
+    def submit_from_other_worker(self, conversation_id, turn):
+        results = []
+        worker = threading.Thread(
+            target=lambda: results.append(self.queue.submit(conversation_id, turn, self.process))
+        )
+        worker.start()
+        worker.join()
+        return results[0]
+
+    def process(self, turns):
+        self.processed.append(turns)
+        if turns == [1]:
+            # Submitted elsewhere while this worker owns conversation 1
+            self.nested = [
+                self.submit_from_other_worker('1', 2),
+                self.submit_from_other_worker('1', 3),
+                self.submit_from_other_worker('2', 10),
+            ]
+
+    def test_turns_run_in_order_on_the_owner(self):
+        """Test turns of one conversation are serialized and others run alongside"""
+        self.assertTrue(self.queue.submit('1', 1, self.process))
+        self.assertEqual(self.processed, [[1], [10], [2, 3]])
+        self.assertEqual(self.nested, [False, False, True])
+
+    @override_settings(CHAT_TURN_BATCH_SIZE=1)
+    def test_merging_disabled(self):
+        """Test queued turns are handed over one by one without merging"""
+        self.queue.submit('1', 1, self.process)
+        self.assertEqual(self.processed, [[1], [10], [2], [3]])
+
+@override_settings(CHAT_UPLOAD_MAX_BYTES=10, CHAT_UPLOAD_CHUNK_BYTES=4)
+class UploadSessionTests(TestCase):
+    def setUp(self):
+        """Set up a conversation and a temporary media root"""
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media_root.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.create_user(username='uploader', password='testpass123')
+        self.conversation = Conversation.objects.create(user=self.user, title='Uploads')
+
+    async def test_chunked_upload(self):
+        """Test chunks are stored, hashed and completed in order"""
+        session = UploadSession(self.conversation, self.user)
+        upload = await session.start('notes.txt', 6, 'text/plain')
+        await session.write_chunk(str(upload.id), 0, b'hell')
+        upload = await session.write_chunk(str(upload.id), 4, b'o!')
+
+        self.assertIsNotNone(upload.completed_at)
+        self.assertEqual(upload.sha256, hashlib.sha256(b'hello!').hexdigest())
+        with upload.file.open('rb') as fh:
+            self.assertEqual(fh.read(), b'hello!')
+
+    async def test_resume_on_new_connection(self):
+        """Test an upload continues from its stored offset"""
+        upload = await UploadSession(self.conversation, self.user).start('a.bin', 6)
+        await UploadSession(self.conversation, self.user).write_chunk(str(upload.id), 0, b'abc')
+
+        session = UploadSession(self.conversation, self.user)
+        self.assertEqual((await session.resume(str(upload.id))).received, 3)
+        upload = await session.write_chunk(str(upload.id), 3, 'ZGVm')
+        self.assertEqual(upload.sha256, hashlib.sha256(b'abcdef').hexdigest())
+
+    async def test_resume_drops_unsaved_chunk(self):
+        """Test bytes written after the last saved offset are discarded on resume"""
+        upload = await UploadSession(self.conversation, self.user).start('a.bin', 6)
+        await UploadSession(self.conversation, self.user).write_chunk(str(upload.id), 0, b'abc')
+        # Appended by a worker that died before saving the new offset
+        with open(upload.file.path, 'ab') as fh:
+            fh.write(b'de')
+
+        session = UploadSession(self.conversation, self.user)
+        upload = await session.write_chunk(str(upload.id), 3, b'def')
+        self.assertEqual(upload.sha256, hashlib.sha256(b'abcdef').hexdigest())
+        with upload.file.open('rb') as fh:
+            self.assertEqual(fh.read(), b'abcdef')
+
+    async def test_limits(self):
+        """Test size limits and out-of-order chunks are rejected"""
+        session = UploadSession(self.conversation, self.user)
+        with self.assertRaises(ValueError):
+            await session.start('big.bin', 11)
+        upload = await session.start('a.bin', 8)
+        with self.assertRaises(ValueError):
+            await session.write_chunk(str(upload.id), 0, b'12345')
+        with self.assertRaises(ValueError):
+            await session.write_chunk(str(upload.id), 2, b'12')
+
+@override_settings(
+    SECRET_KEY='django-insecure-test-key-123',
+    MIDDLEWARE=[
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+    ],
+    CHAT_DOWNLOAD_ACCEL_PREFIX=''
+)
+class FileDownloadTests(TestCase):
+    def setUp(self):
+        """Set up a stored file and a signed link to it"""
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media_root.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        name = default_storage.save('chat_uploads/report', ContentFile(b'0123456789'))
+        self.link = signed_url(name, 'report.txt', 'text/plain', 'abc123')
+
+    def test_full_download(self):
+        """Test the whole file is served with its ETag"""
+        response = self.client.get(self.link['url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['ETag'], '"abc123"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_range_download(self):
+        """Test a byte range is served as partial content"""
+        response = self.client.get(self.link['url'], HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+
+        response = self.client.get(self.link['url'], HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match skips the transfer"""
+        response = self.client.get(self.link['url'], HTTP_IF_NONE_MATCH='"abc123"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_tampered_link(self):
+        """Test a tampered token is rejected"""
+        response = self.client.get(self.link['url'].replace('/files/', '/files/x'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_github_file(self):
+        """Test a GitHub file is stored under a valid blob SHA only"""
+        sha = 'a' * 40
+        link = cache_github_file({'path': 'docs/readme.md', 'sha': sha, 'content': 'hello'})
+        self.assertEqual((link['name'], link['etag'], link['size']), ('readme.md', sha, 5))
+
+        link = cache_github_file({'path': 'notes.md', 'sha': '../../settings', 'content': 'hi'})
+        self.assertEqual(link['etag'], hashlib.sha256(b'hi').hexdigest())
+
+    @override_settings(CHAT_DOWNLOAD_CACHE_MAX_BYTES=8, CHAT_DOWNLOAD_URL_TTL=0)
+    def test_github_cache_eviction(self):
+        """Test the least recently served files are evicted once over the cap"""
+        for index, sha in enumerate(('a' * 40, 'b' * 40, 'c' * 40)):
+            cache_github_file({'path': 'f', 'sha': sha, 'content': 'x' * 4})
+            os.utime(default_storage.path(f"{GITHUB_CACHE_DIR}/{sha}"), (index, index))
+
+        cache_github_file({'path': 'f', 'sha': 'd' * 40, 'content': 'x' * 4})
+        _, cached = default_storage.listdir(GITHUB_CACHE_DIR)
+        self.assertEqual(sorted(cached), ['c' * 40, 'd' * 40])
+
+    @override_settings(CHAT_DOWNLOAD_ACCEL_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        """Test nginx is asked to serve the file when configured"""
+        response = self.client.get(self.link['url'])
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/chat_uploads/report')
@@ -0,0 +1,196 @@
+"""
+Ordered turn processing for conversations across workers.
+
+Every submitted message is appended to its conversation's turn list in
+Redis. Whichever worker holds the conversation's lock drains that list in
+order; workers that find the lock taken only enqueue. Turns of one
+conversation are therefore processed one at a time and in submission order
+no matter which worker received them, while different conversations run in
+parallel on any worker.
+
+Messages that queue up while a turn is running (a user sending several
+lines in quick succession) are handed over together, up to
+``CHAT_TURN_BATCH_SIZE``, so they are answered with a single LLM call.
+
+Turns are moved to a processing list rather than popped and are only
+dropped once they have been processed, so turns of a worker that dies
+mid-turn are picked up again by the conversation's next owner. The lock is
+kept alive by a heartbeat while a turn runs, however long the LLM takes.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from django.conf import settings
+from redis.exceptions import LockError
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def _queue_key(conversation_id) -> str:
+    return f"chat:turns:{conversation_id}"
+
+
+def _processing_key(conversation_id) -> str:
+    return f"chat:turns:{conversation_id}:processing"
+
+
+def _lock_key(conversation_id) -> str:
+    return f"chat:turns:{conversation_id}:lock"
+
+
+class _LocalLock:
+    """
+    In-process stand-in for a Redis lock
+    """
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+
+    def acquire(self) -> bool:
+        return self._lock.acquire(blocking=False)
+
+    def reacquire(self) -> None:
+        pass
+
+    def release(self) -> None:
+        self._lock.release()
+
+
+class TurnQueue:
+    """
+    Serializes the turns of each conversation across all workers
+    """
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._queues: Dict[str, deque] = defaultdict(deque)
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+    @property
+    def lock_timeout(self) -> int:
+        return settings.CHAT_TURN_LOCK_TIMEOUT
+
+    @property
+    def batch_size(self) -> int:
+        return max(settings.CHAT_TURN_BATCH_SIZE, 1)
+
+    @property
+    def merge_window(self) -> float:
+        return settings.CHAT_TURN_MERGE_WINDOW
+
+    def submit(self, conversation_id, message_id: int, process: Callable[[List[int]], None]) -> bool:
+        """
+        Queue a turn and process the conversation's queued turns unless
+        another worker already owns the conversation.
+
+        Returns True if this call processed any turns.
+        """
+        self._push(conversation_id, message_id)
+
+        processed = False
+        # Re-check after releasing, a turn may have been queued meanwhile
+        while self._has_pending(conversation_id):
+            lock = self._lock(conversation_id)
+            if not lock.acquire():
+                # The owner picks this turn up before it lets go
+                return processed
+            try:
+                if self.merge_window:
+                    # Give rapid follow-up messages a moment to join the first turn
+                    time.sleep(self.merge_window)
+                while turns := self._pop(conversation_id):
+                    with self._heartbeat(lock, conversation_id):
+                        try:
+                            process(turns)
+                        except Exception as e:
+                            logger.error(f"Error processing turns {turns} of conversation {conversation_id}: {str(e)}")
+                    self._ack(conversation_id)
+                    processed = True
+                    # Keep ownership while there is work left
+                    lock.reacquire()
+            except LockError:
+                # Expired during a slow turn; whoever holds it now drains the rest
+                logger.error(f"Turn lock of conversation {conversation_id} expired while processing")
+                return processed
+            lock.release()
+        return processed
+
+    def _lock(self, conversation_id):
+        client = get_redis()
+        if client is not None:
+            # Not thread-local, the heartbeat extends it from another thread
+            return client.lock(
+                _lock_key(conversation_id),
+                timeout=self.lock_timeout,
+                blocking=False,
+                thread_local=False
+            )
+        with self._guard:
+            return _LocalLock(self._locks[str(conversation_id)])
+
+    @contextmanager
+    def _heartbeat(self, lock, conversation_id):
+        """Keep the lock from expiring while a turn is processed"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lock_timeout / 3):
+                try:
+                    lock.reacquire()
+                except LockError:
+                    logger.error(f"Lost the turn lock of conversation {conversation_id} while processing")
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _push(self, conversation_id, message_id: int) -> None:
+        client = get_redis()
+        if client is not None:
+            client.rpush(_queue_key(conversation_id), message_id)
+            return
+        with self._guard:
+            self._queues[str(conversation_id)].append(message_id)
+
+    def _pop(self, conversation_id) -> List[int]:
+        client = get_redis()
+        if client is not None:
+            processing = _processing_key(conversation_id)
+            # Left behind by an owner that died mid-turn
+            turns = client.lrange(processing, 0, -1)
+            if not turns:
+                with client.pipeline() as pipe:
+                    for _ in range(self.batch_size):
+                        pipe.lmove(_queue_key(conversation_id), processing, 'LEFT', 'RIGHT')
+                    turns = [turn for turn in pipe.execute() if turn is not None]
+            return [int(turn) for turn in turns]
+        with self._guard:
+            queue = self._queues[str(conversation_id)]
+            return [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+
+    def _ack(self, conversation_id) -> None:
+        client = get_redis()
+        if client is not None:
+            client.delete(_processing_key(conversation_id))
+
+    def _has_pending(self, conversation_id) -> bool:
+        client = get_redis()
+        if client is not None:
+            with client.pipeline() as pipe:
+                pipe.llen(_queue_key(conversation_id))
+                pipe.llen(_processing_key(conversation_id))
+                return sum(pipe.execute()) > 0
+        with self._guard:
+            return bool(self._queues[str(conversation_id)])
+
+
+turn_queue = TurnQueue()
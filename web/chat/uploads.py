@@ -0,0 +1,143 @@
+"""
+Chunked file uploads over the chat WebSocket.
+
+Clients announce a file with ``file_upload_start`` and then send it as
+``file_chunk`` frames (raw bytes with msgpack, base64 with JSON). Chunks are
+appended straight to media storage and hashed as they arrive, so the file is
+never held in memory or sent through the channel layer. An interrupted
+upload continues from the stored offset with ``file_upload_resume``.
+"""
+import base64
+import hashlib
+import os
+from typing import Dict, Union
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .models import FileUpload
+
+
+def _create_file(path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+
+def _append_chunk(path: str, data: bytes, digest) -> None:
+    with open(path, 'ab') as fh:
+        fh.write(data)
+    digest.update(data)
+
+
+def _hash_file(path: str, length: int):
+    digest = hashlib.sha256()
+    with open(path, 'r+b') as fh:
+        # A crash between appending a chunk and saving the offset leaves
+        # bytes the client will send again
+        fh.truncate(length)
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest
+
+
+class UploadSession:
+    """
+    Tracks the chunked uploads of a single WebSocket connection
+    """
+    def __init__(self, conversation, user):
+        self.conversation = conversation
+        self.user = user
+        self._uploads: Dict[str, FileUpload] = {}
+        self._digests: Dict[str, "hashlib._Hash"] = {}
+
+    @property
+    def chunk_size(self) -> int:
+        return settings.CHAT_UPLOAD_CHUNK_BYTES
+
+    async def start(self, name: str, size: int, content_type: str = '', kind: str = '') -> FileUpload:
+        """
+        Register a new upload and create its empty file in storage
+        """
+        if not name:
+            raise ValueError("No file name provided")
+        if size <= 0:
+            raise ValueError("File is empty")
+        if size > settings.CHAT_UPLOAD_MAX_BYTES:
+            raise ValueError(f"File exceeds the {settings.CHAT_UPLOAD_MAX_BYTES} byte upload limit")
+
+        upload = FileUpload(
+            conversation=self.conversation,
+            user=self.user,
+            name=os.path.basename(name)[:255],
+            content_type=content_type[:100],
+            kind=kind[:20],
+            size=size
+        )
+        upload.file.name = f"chat_uploads/{upload.id}"
+        await sync_to_async(_create_file, thread_sensitive=False)(default_storage.path(upload.file.name))
+        await upload.asave(force_insert=True)
+
+        self._uploads[str(upload.id)] = upload
+        self._digests[str(upload.id)] = hashlib.sha256()
+        return upload
+
+    async def resume(self, upload_id: str) -> FileUpload:
+        """
+        Continue an interrupted upload from its stored offset
+        """
+        upload = await self._get_upload(upload_id)
+        if str(upload.id) not in self._digests:
+            # Rebuild the running hash from what is already stored
+            self._digests[str(upload.id)] = await sync_to_async(_hash_file, thread_sensitive=False)(
+                default_storage.path(upload.file.name), upload.received
+            )
+        return upload
+
+    async def write_chunk(self, upload_id: str, offset: int, data: Union[bytes, str]) -> FileUpload:
+        """
+        Append a chunk at the expected offset, completing the upload on the last one
+        """
+        upload = await self.resume(upload_id)
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+
+        if offset != upload.received:
+            raise ValueError(f"Expected chunk at offset {upload.received}, got {offset}")
+        if len(data) > self.chunk_size:
+            raise ValueError(f"Chunk exceeds {self.chunk_size} bytes")
+        if upload.received + len(data) > upload.size:
+            raise ValueError("Chunk exceeds the announced file size")
+
+        digest = self._digests[str(upload.id)]
+        await sync_to_async(_append_chunk, thread_sensitive=False)(
+            default_storage.path(upload.file.name), data, digest
+        )
+        upload.received += len(data)
+        update_fields = ['received']
+
+        if upload.received == upload.size:
+            upload.sha256 = digest.hexdigest()
+            upload.completed_at = timezone.now()
+            update_fields += ['sha256', 'completed_at']
+            self._uploads.pop(str(upload.id), None)
+            self._digests.pop(str(upload.id), None)
+
+        await upload.asave(update_fields=update_fields)
+        return upload
+
+    async def _get_upload(self, upload_id: str) -> FileUpload:
+        upload = self._uploads.get(str(upload_id))
+        if upload is None:
+            try:
+                upload = await FileUpload.objects.aget(
+                    id=upload_id,
+                    conversation=self.conversation,
+                    completed_at__isnull=True
+                )
+            except (FileUpload.DoesNotExist, ValidationError):
+                raise ValueError("Upload not found or already completed")
+            self._uploads[str(upload.id)] = upload
+        return upload
@@ -11,5 +11,7 @@ urlpatterns = [
     path('', views.ChatListView.as_view(), name='list'),
     path('room/', views.ChatRoomView.as_view(), name='chat_room'),
     path('room/<int:pk>/', views.ChatRoomView.as_view(), name='chat_room'),
+    path('files/<str:token>/', views.FileDownloadView.as_view(), name='file_download'),
+    path('api/metrics/', views.ChannelMetricsView.as_view(), name='channel_metrics'),
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,42 +1,104 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.generic import TemplateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.contrib.auth.views import redirect_to_login
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified,
+    JsonResponse, StreamingHttpResponse
+)
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.urls import reverse
+from django.utils.http import content_disposition_header, parse_etags, quote_etag
 from datetime import datetime
+import hashlib
 import logging
+import mimetypes
+from . import downloads, list_cache
+from .outbound import channel_metrics
+from .event_log import event_log
 from .models import Conversation, Message
 from .serializers import ConversationSerializer, MessageSerializer
+from .workers import REPLY_CHANNEL
 from django.contrib.auth import get_user_model
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-class ChatListView(LoginRequiredMixin, View):
+
+async def _get_user(request):
+    """
+    Resolve the lazy request user outside the event loop, None if anonymous
+    """
+    def resolve():
+        return request.user if request.user.is_authenticated else None
+    return await sync_to_async(resolve)()
+
+
+class ChatListView(View):
     """
     View for displaying the chat list page and handling new messages.
+    The conversation list is rendered once per list version and cached;
+    AI replies are generated by the reply worker and pushed over the WebSocket.
     """
     template_name = 'chat/list.html'
+    fragment_template_name = 'chat/_conversation_list.html'
+
+    async def get(self, request, *args, **kwargs):
+        user = await _get_user(request)
+        if user is None:
+            return redirect_to_login(request.get_full_path())
 
-    def get(self, request, *args, **kwargs):
         chat_type = request.GET.get('type', 'cto')
-        conversations = Conversation.objects.filter(
-            user=request.user,
-            chat_type=chat_type
-        ).order_by('updated_at')  # Order by oldest first
-        
+        version = await list_cache.aget_version(user.id)
+        conversation_list = await list_cache.aget_fragment(user.id, chat_type, version)
+        if conversation_list is None:
+            conversation_list = await sync_to_async(self.render_conversation_list)(request, user, chat_type)
+            await list_cache.aset_fragment(user.id, chat_type, version, conversation_list)
+
         context = {
-            'conversations': conversations,
+            'conversation_list': conversation_list,
             'current_chat_type': chat_type,
             'chat_types': Conversation.CHAT_TYPES
         }
-        return render(request, self.template_name, context)
+        return await sync_to_async(render)(request, self.template_name, context)
+
+    def render_conversation_list(self, request, user, chat_type):
+        """
+        Render the conversation list fragment
+        """
+        conversations = Conversation.objects.filter(
+            user=user,
+            chat_type=chat_type
+        ).select_related('user').annotate(
+            last_message=Subquery(
+                Message.objects.filter(
+                    conversation=OuterRef('pk')
+                ).order_by('-created_at').values('content')[:1]
+            )
+        ).order_by('updated_at')  # Order by oldest first
+
+        return render_to_string(self.fragment_template_name, {
+            'conversations': conversations,
+        }, request=request)
 
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
         """Handle new message creation"""
+        user = await _get_user(request)
+        if user is None:
+            return redirect_to_login(request.get_full_path())
+
         chat_type = request.GET.get('type', 'cto')
         message_content = request.POST.get('message')
 
@@ -49,55 +111,47 @@ class ChatListView(LoginRequiredMixin, View):
             return redirect('chat:list')
 
         try:
-            # Get or create the AI user based on chat type
-            ai_username = f'ai_{chat_type}'
-            ai_user, _ = User.objects.get_or_create(
-                username=ai_username,
-                defaults={'email': f'{ai_username}@example.com'}
-            )
-
             # Create a new conversation
-            conversation = Conversation.objects.create(
-                user=request.user,
+            conversation = await Conversation.objects.acreate(
+                user=user,
                 chat_type=chat_type,
                 title=f"Chat with {chat_type.upper()}"
             )
 
             # Create user message
-            user_message = Message.objects.create(
+            user_message = await Message.objects.acreate(
                 conversation=conversation,
-                user=request.user,
+                user=user,
                 content=message_content,
-                is_ai=False,
-                created_at=timezone.now()
+                is_ai=False
             )
 
-            # Generate AI response
-            from web.core.ai.conversation_manager import conversation_manager
-            ai_response = conversation_manager.generate_response(
-                message_content,
-                chat_type
-            )
+            # Sequence the user message so the socket can resume right after it
+            event = await event_log.aevent(conversation.id, 'chat_message', {
+                'id': user_message.id,
+                'role': 'user',
+                'content': user_message.content,
+                'created_at': user_message.created_at.isoformat(),
+            })
 
-            # Create AI message with the AI user
-            ai_message = Message.objects.create(
-                conversation=conversation,
-                user=ai_user,  # Use AI user instead of request.user
-                content=ai_response,
-                is_ai=True,
-                created_at=timezone.now()
-            )
+            # Generate the AI reply in the worker instead of blocking this request
+            await get_channel_layer().send(REPLY_CHANNEL, {
+                'type': 'generate_reply',
+                'message_id': user_message.id
+            })
 
             if is_ajax:
-                # Return JSON response for AJAX requests
+                # The reply arrives on the conversation socket
                 return JsonResponse({
-                    'status': 'success',
+                    'status': 'accepted',
+                    'conversation_id': conversation.id,
+                    'after_seq': event['seq'],
                     'message': {
-                        'content': ai_response,
-                        'is_ai': True,
-                        'created_at': timezone.localtime(ai_message.created_at).strftime('%H:%M')
+                        'content': user_message.content,
+                        'is_ai': False,
+                        'created_at': timezone.localtime(user_message.created_at).strftime('%H:%M')
                     }
-                })
+                }, status=202)
             else:
                 # Redirect for regular form submissions
                 return redirect('chat:list')
@@ -131,15 +185,92 @@ class ChatRoomView(LoginRequiredMixin, TemplateView):
                 user=self.request.user
             )
             context['conversation'] = conversation
-            context['messages'] = conversation.messages.all().order_by('created_at')
+
+            # Only the latest window is rendered, older history is paged in by the client
+            window = list(
+                conversation.messages.select_related('user').order_by('-id')[:settings.CHAT_HISTORY_PAGE_SIZE]
+            )[::-1]
+            context['messages'] = window
+            context['has_older_messages'] = len(window) == settings.CHAT_HISTORY_PAGE_SIZE
+            context['history_url'] = reverse('chat_api:conversation-messages', args=[conversation.pk])
         else:
             # New conversation
             context['conversation'] = None
             context['messages'] = []
+            context['has_older_messages'] = False
             
         return context
 
 
+class FileDownloadView(View):
+    """
+    View serving chat files behind signed, short-lived links.
+    Supports ETag revalidation and single byte ranges, or hands the
+    transfer to nginx with X-Accel-Redirect when configured.
+    """
+    def get(self, request, token, *args, **kwargs):
+        try:
+            file_info = downloads.load_token(token)
+        except signing.BadSignature:
+            raise Http404("Download link is invalid or has expired")
+
+        name = file_info['name']
+        if not default_storage.exists(name):
+            raise Http404("File not found")
+
+        etag = f'"{file_info["etag"]}"' if file_info.get('etag') else None
+        if etag and request.headers.get('If-None-Match') == etag:
+            return HttpResponseNotModified()
+
+        content_type = (
+            file_info.get('content_type')
+            or mimetypes.guess_type(file_info['filename'])[0]
+            or 'application/octet-stream'
+        )
+
+        if settings.CHAT_DOWNLOAD_ACCEL_PREFIX:
+            # nginx serves the file (and any Range) from its internal location
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.CHAT_DOWNLOAD_ACCEL_PREFIX + name
+        else:
+            size = default_storage.size(name)
+            try:
+                byte_range = downloads.parse_range(request.headers.get('Range', ''), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+            if byte_range is None:
+                # FileResponse uses the server's file wrapper (sendfile) when available
+                response = FileResponse(default_storage.open(name, 'rb'), content_type=content_type)
+            else:
+                start, end = byte_range
+                response = StreamingHttpResponse(
+                    downloads.iter_range(default_storage.open(name, 'rb'), start, end - start + 1),
+                    status=206,
+                    content_type=content_type
+                )
+                response['Content-Range'] = f'bytes {start}-{end}/{size}'
+                response['Content-Length'] = str(end - start + 1)
+            response['Accept-Ranges'] = 'bytes'
+
+        response['Content-Disposition'] = content_disposition_header(True, file_info['filename'])
+        response['Cache-Control'] = f'private, max-age={settings.CHAT_DOWNLOAD_URL_TTL}'
+        if etag:
+            response['ETag'] = etag
+        return response
+
+
+class ChannelMetricsView(APIView):
+    """
+    Channel layer limits and outbound queue counters of the serving process
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(channel_metrics())
+
 class ConversationViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing conversations.
@@ -163,15 +294,30 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def send_message(self, request, pk=None):
         """
         Send a message in the conversation.
+        A retried request with the same client_id returns the stored message.
         """
         conversation = self.get_object()
+        client_id = request.data.get('client_id')
+        if client_id:
+            existing = Message.objects.filter(conversation=conversation, client_id=client_id).first()
+            if existing:
+                return Response(MessageSerializer(existing).data, status=status.HTTP_200_OK)
+
         serializer = MessageSerializer(data=request.data)
         
         if serializer.is_valid():
-            serializer.save(
-                conversation=conversation,
-                user=request.user
-            )
+            try:
+                with transaction.atomic():
+                    serializer.save(
+                        conversation=conversation,
+                        user=request.user
+                    )
+            except IntegrityError:
+                if not client_id:
+                    raise
+                # A concurrent retry stored it between the check and the insert
+                existing = Message.objects.get(conversation=conversation, client_id=client_id)
+                return Response(MessageSerializer(existing).data, status=status.HTTP_200_OK)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -179,8 +325,49 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def messages(self, request, pk=None):
         """
         Get all messages in a conversation.
+        Pass ?after=<message id> to resume from the last message a client received,
+        or ?before=<message id> to page back through older history (keyset, newest
+        ``limit`` messages first). Responses carry an ETag for browser revalidation.
         """
         conversation = self.get_object()
-        messages = Message.objects.filter(conversation=conversation)
+        messages = Message.objects.filter(conversation=conversation).select_related('user')
+        params = {}
+        for name, minimum in (('after', 0), ('before', 0), ('limit', 1)):
+            try:
+                params[name] = int(request.query_params[name]) if name in request.query_params else None
+            except ValueError:
+                return Response({name: 'Must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            if params[name] is not None and params[name] < minimum:
+                return Response({name: f'Must be at least {minimum}'}, status=status.HTTP_400_BAD_REQUEST)
+        after, before = params['after'], params['before']
+        limit = min(params['limit'], settings.CHAT_HISTORY_MAX_PAGE_SIZE) if params['limit'] is not None else None
+
+        if after:
+            messages = messages.filter(id__gt=after)
+        if before:
+            # Walk backwards from the cursor, then restore chronological order
+            messages = messages.filter(id__lt=before).order_by('-id')[:limit or settings.CHAT_HISTORY_PAGE_SIZE]
+            messages = list(messages)[::-1]
+        elif limit:
+            messages = messages.order_by('id')[:limit]
+
+        messages = list(messages)
+        etag = _messages_etag(conversation.id, messages)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
         serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        response = Response(serializer.data)
+        response['ETag'] = etag
+        if before:
+            # Older history only changes when messages are deleted
+            response['Cache-Control'] = f'private, max-age={settings.CHAT_HISTORY_MAX_AGE}'
+        return response
+
+
+def _messages_etag(conversation_id, messages):
+    """
+    Build an ETag for a page of messages, which are never edited in place
+    """
+    ids = ','.join(str(message.id) for message in messages)
+    return quote_etag(hashlib.md5(f"{conversation_id}:{ids}".encode()).hexdigest())
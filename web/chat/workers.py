@@ -0,0 +1,70 @@
+"""
+Background channel workers for chat.
+
+Run with ``python manage.py runworker chat-replies``.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from channels.consumer import AsyncConsumer
+from django.contrib.auth import get_user_model
+
+from .event_log import event_log
+from .models import Message
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+REPLY_CHANNEL = 'chat-replies'
+
+
+class ReplyWorker(AsyncConsumer):
+    """
+    Generates AI replies for messages posted from the chat list page
+    and delivers them to the conversation's WebSocket group
+    """
+    async def generate_reply(self, event):
+        message = await Message.objects.select_related('conversation').aget(id=event['message_id'])
+        conversation = message.conversation
+        chat_type = conversation.chat_type
+
+        try:
+            from web.core.ai.conversation_manager import conversation_manager
+            content = await sync_to_async(conversation_manager.generate_response, thread_sensitive=False)(
+                message.content,
+                chat_type
+            )
+        except Exception as e:
+            logger.error(f"Error generating reply for message {message.id}: {str(e)}")
+            await self.channel_layer.group_send(
+                f"chat_{conversation.id}",
+                await event_log.aevent(conversation.id, 'chat_message', {
+                    'role': 'system',
+                    'content': 'Failed to process message. Please try again.',
+                    'metadata': {'error': True}
+                })
+            )
+            return
+
+        # Get or create the AI user based on chat type
+        ai_username = f'ai_{chat_type}'
+        ai_user, _ = await User.objects.aget_or_create(
+            username=ai_username,
+            defaults={'email': f'{ai_username}@example.com'}
+        )
+        ai_message = await Message.objects.acreate(
+            conversation=conversation,
+            user=ai_user,
+            content=content,
+            is_ai=True
+        )
+
+        await self.channel_layer.group_send(
+            f"chat_{conversation.id}",
+            await event_log.aevent(conversation.id, 'chat_message', {
+                'id': ai_message.id,
+                'role': chat_type,
+                'content': ai_message.content,
+                'created_at': ai_message.created_at.isoformat(),
+            })
+        )
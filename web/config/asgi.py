@@ -4,9 +4,10 @@ ASGI config for AI Team Platform project.
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.routing import ChannelNameRouter, ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from web.chat.routing import websocket_urlpatterns
+from web.chat.workers import REPLY_CHANNEL, ReplyWorker
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web.config.settings')
 
@@ -17,4 +18,7 @@ application = ProtocolTypeRouter({
             websocket_urlpatterns
         )
     ),
+    "channel": ChannelNameRouter({
+        REPLY_CHANNEL: ReplyWorker.as_asgi(),
+    }),
 })
\ No newline at end of file
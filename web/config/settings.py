@@ -70,16 +70,65 @@ WSGI_APPLICATION = 'web.config.wsgi.application'
 ASGI_APPLICATION = 'web.config.asgi.application'
 
 # Channel layer settings
+# Capacity bounds each channel's Redis list; expiry drops messages a slow
+# consumer has not read in time (it resumes from its cursor on reconnect).
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
             "hosts": [(os.environ.get('REDIS_HOST', 'localhost'), 
                       int(os.environ.get('REDIS_PORT', 6379)))],
+            "capacity": int(os.environ.get('CHANNEL_CAPACITY', 200)),
+            "expiry": int(os.environ.get('CHANNEL_EXPIRY', 30)),
+            "group_expiry": int(os.environ.get('CHANNEL_GROUP_EXPIRY', 86400)),
         },
     },
 }
 
+# Maximum frames queued per chat socket before it is closed as a slow consumer
+CHAT_OUTBOUND_QUEUE_SIZE = int(os.environ.get('CHAT_OUTBOUND_QUEUE_SIZE', 256))
+
+# Messages rendered in a chat room and returned per history page, and how long
+# browsers may reuse an older history page before revalidating its ETag
+CHAT_HISTORY_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_PAGE_SIZE', 50))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_MAX_PAGE_SIZE', 200))
+CHAT_HISTORY_MAX_AGE = int(os.environ.get('CHAT_HISTORY_MAX_AGE', 300))
+
+# Events kept per conversation for resuming sockets, and how long they are kept
+CHAT_REPLAY_BUFFER_SIZE = int(os.environ.get('CHAT_REPLAY_BUFFER_SIZE', 200))
+CHAT_REPLAY_TTL = int(os.environ.get('CHAT_REPLAY_TTL', 600))
+
+# Messages of history sent with each AI turn, how long ticket/GitHub context is
+# kept, and how long a worker may own a conversation's turns without progress
+CHAT_CONTEXT_MESSAGES = int(os.environ.get('CHAT_CONTEXT_MESSAGES', 50))
+CHAT_CONTEXT_TTL = int(os.environ.get('CHAT_CONTEXT_TTL', 7 * 24 * 60 * 60))
+CHAT_TURN_LOCK_TIMEOUT = int(os.environ.get('CHAT_TURN_LOCK_TIMEOUT', 300))
+
+# Messages queued behind a running turn that are answered together (1 disables
+# merging), and how long the first turn waits for rapid follow-ups, in seconds
+CHAT_TURN_BATCH_SIZE = int(os.environ.get('CHAT_TURN_BATCH_SIZE', 5))
+CHAT_TURN_MERGE_WINDOW = float(os.environ.get('CHAT_TURN_MERGE_WINDOW', 0))
+
+# How long a client message ID is remembered for deduplicating retried submissions
+CHAT_SUBMISSION_TTL = int(os.environ.get('CHAT_SUBMISSION_TTL', 600))
+
+# Redis used by chat services (presence, sequencing, idempotency)
+CHAT_REDIS_URL = os.environ.get(
+    'CHAT_REDIS_URL',
+    f"redis://{os.environ.get('REDIS_HOST', 'localhost')}:{os.environ.get('REDIS_PORT', 6379)}/1"
+)
+
+# Shared cache, so rendered chat lists and their version counters are seen by every worker
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get(
+            'CACHE_URL',
+            f"redis://{os.environ.get('REDIS_HOST', 'localhost')}:{os.environ.get('REDIS_PORT', 6379)}/2"
+        ),
+    }
+}
+
 # Database
 DATABASES = {
     'default': {
@@ -137,6 +186,17 @@ STATICFILES_FINDERS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'web' / 'media'
 
+# Chat uploads are streamed to MEDIA_ROOT in chunks of at most this size
+CHAT_UPLOAD_MAX_BYTES = int(os.environ.get('CHAT_UPLOAD_MAX_BYTES', 25 * 1024 * 1024))
+CHAT_UPLOAD_CHUNK_BYTES = int(os.environ.get('CHAT_UPLOAD_CHUNK_BYTES', 256 * 1024))
+
+# Lifetime of signed chat download links, and the internal nginx location
+# used to serve them with X-Accel-Redirect (empty to stream from Django)
+CHAT_DOWNLOAD_URL_TTL = int(os.environ.get('CHAT_DOWNLOAD_URL_TTL', 300))
+CHAT_DOWNLOAD_ACCEL_PREFIX = os.environ.get('CHAT_DOWNLOAD_ACCEL_PREFIX', '')
+# Size cap of the cache of files fetched from GitHub for download
+CHAT_DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get('CHAT_DOWNLOAD_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -38,4 +38,7 @@ CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
     }
-}
\ No newline at end of file
+}
+
+# Keep chat services in-process during tests
+CHAT_REDIS_URL = None
@@ -9,6 +9,9 @@ from ai.conversation_manager import conversation_manager
 from tickets.ticket_manager import ticket_manager
 from github.github_client import github_manager
 
+# Most recent tickets included in the AI context
+CONTEXT_TICKET_LIMIT = 20
+
 class AITeamManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -21,10 +24,12 @@ class AITeamManager(commands.Cog):
     async def get_context_data(self, ctx) -> Dict:
         """Gather context data for AI responses"""
         try:
-            # Get active tickets
+            # Get the most recent tickets of the author, IDs only
             active_tickets = await ticket_manager.list_tickets(
                 status=None,  # All statuses
-                assigned_to=str(ctx.author.id)
+                assigned_to=str(ctx.author.id),
+                columns='id',
+                limit=CONTEXT_TICKET_LIMIT
             )
 
             # Get recent GitHub activity
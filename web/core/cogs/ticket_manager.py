@@ -1,46 +1,78 @@
 import discord
 from discord.ext import commands
-from typing import Optional, List
-from datetime import datetime, timezone
+from typing import Optional, List, Dict
 import asyncio
 from config import settings
 from utils.logger import logger
-from database.supabase_client import db
 from tickets.ticket_manager import ticket_manager
+from tickets.notification_dispatcher import notification_dispatcher
+from tickets.due_date_scheduler import due_date_scheduler
+from tickets.similarity_index import similarity_index
 from tickets.ticket_types import (
-    Ticket, TicketStatus, TicketPriority, TicketType,
+    TicketStatus, TicketPriority, TicketType,
     format_ticket_for_discord
 )
 
+EMBED_DESCRIPTION_LIMIT = 4096
+
 class TicketManagerCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.notification_task = self.bot.loop.create_task(self.check_notifications())
+        self.notification_task = self.bot.loop.create_task(self.dispatch_notifications())
+        self.due_date_task = self.bot.loop.create_task(self.schedule_due_dates())
+        self.similarity_task = self.bot.loop.create_task(self.load_similarity_index())
 
-    async def check_notifications(self):
-        """Check for new notifications periodically"""
+    async def dispatch_notifications(self):
+        """Deliver ticket notifications as they are created"""
+        await self.bot.wait_until_ready()
         try:
-            while not self.bot.is_closed():
-                notifications = await db.table('ticket_notifications').select('*').eq('read', False).execute()
-                
-                for notification in notifications.data:
-                    channel = self.bot.get_channel(int(settings.TICKET_NOTIFICATIONS_CHANNEL))
-                    if channel:
-                        embed = discord.Embed(
-                            title="Ticket Notification",
-                            description=notification["message"],
-                            color=discord.Color.blue()
-                        )
-                        await channel.send(f"<@{notification['user_id']}>", embed=embed)
-                        
-                        # Mark as read
-                        await db.table('ticket_notifications').update(
-                            {'read': True}
-                        ).eq('id', notification['id']).execute()
-
-                await asyncio.sleep(60)  # Check every minute
+            await notification_dispatcher.run(self.send_notifications)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in notification dispatcher: {str(e)}")
+
+    async def schedule_due_dates(self):
+        """Notify assignees when their tickets come due"""
+        await self.bot.wait_until_ready()
+        try:
+            await due_date_scheduler.run(ticket_manager.notify_due_date)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Error in notification checker: {str(e)}")
+            logger.error(f"Error in due date scheduler: {str(e)}")
+
+    async def load_similarity_index(self):
+        """Build the duplicate index up front so the first ticket is not kept waiting"""
+        try:
+            await similarity_index.ensure_loaded()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error loading ticket similarity index: {str(e)}")
+
+    async def send_notifications(self, user_id: str, notifications: List[Dict]):
+        """Send a user's pending notifications as one message"""
+        channel = self.bot.get_channel(int(settings.TICKET_NOTIFICATIONS_CHANNEL))
+        if not channel:
+            raise ValueError(f"Ticket notifications channel {settings.TICKET_NOTIFICATIONS_CHANNEL} not found")
+
+        lines = [f"• {notification['message']}" for notification in notifications]
+        description = ""
+        for index, line in enumerate(lines):
+            remaining = len(lines) - index
+            # Stay within Discord's embed description limit
+            if len(description) + len(line) > EMBED_DESCRIPTION_LIMIT - 32:
+                description += f"…and {remaining} more"
+                break
+            description += line + "\n"
+
+        embed = discord.Embed(
+            title="Ticket Notification" if len(notifications) == 1 else f"{len(notifications)} Ticket Notifications",
+            description=description.strip(),
+            color=discord.Color.blue()
+        )
+        await channel.send(f"<@{user_id}>", embed=embed)
 
     @commands.has_permissions(manage_messages=True)
     @commands.command(name="create_ticket")
@@ -69,6 +101,9 @@ class TicketManagerCog(commands.Cog):
                 await ctx.send("❌ Invalid priority. Use: low, medium, high, or urgent")
                 return
 
+            # Looked up before creating so the new ticket is not its own match
+            similar = await ticket_manager.find_similar_tickets(title, description)
+
             ticket = await ticket_manager.create_ticket(
                 title=title,
                 description=description,
@@ -78,6 +113,15 @@ class TicketManagerCog(commands.Cog):
             )
 
             embed = discord.Embed(**format_ticket_for_discord(ticket))
+            if similar:
+                embed.add_field(
+                    name="Possible Duplicates",
+                    value="\n".join(
+                        f"#{match['id']}: {match['title'][:80]} ({match['similarity']:.0%})"
+                        for match in similar
+                    ),
+                    inline=False
+                )
             await ctx.send("✅ Ticket created!", embed=embed)
 
         except Exception as e:
@@ -179,28 +223,25 @@ class TicketManagerCog(commands.Cog):
                     await ctx.send(f"❌ Invalid priority. Use: {priorities}")
                     return
 
-            tickets = await ticket_manager.list_tickets(
-                status=ticket_status,
-                priority=ticket_priority
-            )
+            tickets_per_page = 5
 
-            if not tickets:
-                await ctx.send("No tickets found matching the criteria.")
-                return
+            async def fetch_page(after=None):
+                # One extra row tells whether another page follows
+                page_tickets = await ticket_manager.list_tickets(
+                    status=ticket_status,
+                    priority=ticket_priority,
+                    limit=tickets_per_page + 1,
+                    after=after
+                )
+                return page_tickets[:tickets_per_page], len(page_tickets) > tickets_per_page
 
-            # Create paginated embeds for tickets
-            tickets_per_page = 5
-            pages = []
-            
-            for i in range(0, len(tickets), tickets_per_page):
-                page_tickets = tickets[i:i + tickets_per_page]
+            def build_embed(page_tickets):
                 embed = discord.Embed(
                     title="Ticket List",
                     color=discord.Color.blue()
                 )
                 
                 for ticket in page_tickets:
-                    ticket_obj = Ticket(**ticket)
                     assignees = ", ".join(f"<@{a['user_id']}>" for a in ticket["assignees"]) or "None"
                     
                     embed.add_field(
@@ -210,15 +251,23 @@ class TicketManagerCog(commands.Cog):
                               f"Assignees: {assignees}",
                         inline=False
                     )
-                
-                pages.append(embed)
+                return embed
+
+            page_tickets, has_more = await fetch_page()
+            if not page_tickets:
+                await ctx.send("No tickets found matching the criteria.")
+                return
+
+            # Pages are fetched as the user navigates forward
+            pages = [build_embed(page_tickets)]
+            last_ticket = page_tickets[-1]
 
             # Send first page
             current_page = 0
             message = await ctx.send(embed=pages[current_page])
 
             # Add navigation reactions
-            if len(pages) > 1:
+            if has_more:
                 await message.add_reaction("◀️")
                 await message.add_reaction("▶️")
 
@@ -233,9 +282,15 @@ class TicketManagerCog(commands.Cog):
                             check=check
                         )
 
-                        if str(reaction.emoji) == "▶️" and current_page < len(pages) - 1:
-                            current_page += 1
-                            await message.edit(embed=pages[current_page])
+                        if str(reaction.emoji) == "▶️":
+                            if current_page == len(pages) - 1 and has_more:
+                                page_tickets, has_more = await fetch_page(after=last_ticket)
+                                if page_tickets:
+                                    pages.append(build_embed(page_tickets))
+                                    last_ticket = page_tickets[-1]
+                            if current_page < len(pages) - 1:
+                                current_page += 1
+                                await message.edit(embed=pages[current_page])
                         elif str(reaction.emoji) == "◀️" and current_page > 0:
                             current_page -= 1
                             await message.edit(embed=pages[current_page])
@@ -292,9 +347,44 @@ class TicketManagerCog(commands.Cog):
             logger.error(f"Error generating report: {str(e)}")
             await ctx.send("❌ Failed to generate report. Please check the logs.")
 
+    @commands.command(name="ticket_blockers")
+    async def ticket_blockers(self, ctx, ticket_id: str):
+        """Show everything a ticket is waiting on"""
+        try:
+            blockers = await ticket_manager.get_blockers(ticket_id)
+            if not blockers:
+                await ctx.send(f"✅ Ticket #{ticket_id} is not blocked by any ticket.")
+                return
+
+            critical_path = await ticket_manager.get_critical_path(ticket_id)
+
+            embed = discord.Embed(
+                title=f"Blockers of Ticket #{ticket_id}",
+                color=discord.Color.orange()
+            )
+            embed.add_field(
+                name=f"Blocked By ({len(blockers)})",
+                value=", ".join(f"#{blocker}" for blocker in blockers)[:1024],
+                inline=False
+            )
+            embed.add_field(
+                name="Critical Path",
+                value=" → ".join(f"#{ticket}" for ticket in critical_path)[:1024],
+                inline=False
+            )
+            await ctx.send(embed=embed)
+
+        except Exception as e:
+            logger.error(f"Error getting ticket blockers: {str(e)}")
+            await ctx.send("❌ Failed to get ticket blockers. Please check the logs.")
+
     def cog_unload(self):
         """Cleanup when cog is unloaded"""
         self.notification_task.cancel()
+        self.due_date_task.cancel()
+        self.similarity_task.cancel()
+        if similarity_index.loaded:
+            similarity_index.save()
 
 async def setup(bot):
     await bot.add_cog(TicketManagerCog(bot))
\ No newline at end of file
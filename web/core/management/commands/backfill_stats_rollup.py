@@ -0,0 +1,25 @@
+"""
+Rebuild the daily stats rollup from the ticket and workflow tables
+"""
+from django.core.management.base import BaseCommand
+
+from web.core.services import stats_rollup
+from web.core.services.ticket_service import Ticket
+from web.core.services.workflow_service import Workflow
+
+
+class Command(BaseCommand):
+    help = 'Recount the per-day ticket and workflow stats from existing rows; safe to re-run'
+
+    def handle(self, *args, **options):
+        # Resolutions and completions are dated by their last transition,
+        # the only one the tables keep
+        metrics = [
+            ('tickets_created', Ticket.objects.all(), 'created_at'),
+            ('tickets_resolved', Ticket.objects.all(), 'resolved_at'),
+            ('workflows_created', Workflow.objects.all(), 'created_at'),
+            ('workflows_completed', Workflow.objects.all(), 'completion_date'),
+        ]
+        for metric, queryset, field in metrics:
+            counted = stats_rollup.rebuild(metric, queryset, field)
+            self.stdout.write(f"{metric}: {counted}")
@@ -6,6 +6,7 @@ from collections import deque
 from config import settings
 from utils.logger import logger
 from database.supabase_client import db
+from tickets.ticket_cache import ticket_cache
 
 class MetricsCollector:
     """Collects and manages system metrics"""
@@ -256,7 +257,8 @@ class MonitorManager:
                 'performance': {
                     'avg_command_latency': self._calculate_avg_command_latency(),
                     'avg_api_latency': self._calculate_avg_api_latency(),
-                    'error_rate': self._calculate_error_rate()
+                    'error_rate': self._calculate_error_rate(),
+                    'ticket_cache': ticket_cache.stats()
                 }
             }
 
@@ -0,0 +1,75 @@
+"""
+Daily rollup of service counters for time-bucketed stats
+"""
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, QuerySet, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+from web.core.models import BaseModel
+
+PERIODS = ('day', 'week')
+
+
+class StatsRollup(BaseModel):
+    metric = models.CharField(max_length=50)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        app_label = 'core'
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'day'], name='unique_stats_rollup_day'),
+        ]
+
+
+def record(metric: str, when: Optional[datetime] = None) -> None:
+    """
+    Count one event of a metric on the day it happened
+    """
+    day = timezone.localdate(when) if when else timezone.localdate()
+    if StatsRollup.objects.filter(metric=metric, day=day).update(count=F('count') + 1):
+        return
+    try:
+        with transaction.atomic():
+            StatsRollup.objects.create(metric=metric, day=day, count=1)
+    except IntegrityError:
+        # Another request created the row first
+        StatsRollup.objects.filter(metric=metric, day=day).update(count=F('count') + 1)
+
+
+def rebuild(metric: str, queryset: QuerySet, field: str) -> int:
+    """
+    Replace a metric's rollup with the per-day counts of a timestamp field,
+    returning how many events were counted
+    """
+    days = queryset.filter(**{f'{field}__isnull': False}).annotate(
+        day=TruncDate(field)
+    ).values('day').annotate(total=Count('pk')).order_by()
+    rows = [StatsRollup(metric=metric, day=row['day'], count=row['total']) for row in days]
+    with transaction.atomic():
+        StatsRollup.objects.filter(metric=metric).delete()
+        StatsRollup.objects.bulk_create(rows)
+    return sum(row.count for row in rows)
+
+
+def get_series(metrics: List[str], period: str = 'day', since: Optional[date] = None) -> List[Dict]:
+    """
+    Get the metrics per day or week, oldest first; periods without events are left out
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+
+    rows = StatsRollup.objects.filter(metric__in=metrics)
+    if since:
+        rows = rows.filter(day__gte=since)
+    rows = rows.annotate(
+        period=Trunc('day', period, output_field=models.DateField())
+    ).values('period', 'metric').annotate(total=Sum('count')).order_by('period')
+
+    series: Dict[date, Dict] = {}
+    for row in rows:
+        bucket = series.setdefault(row['period'], {'period': row['period'], **{metric: 0 for metric in metrics}})
+        bucket[row['metric']] = row['total']
+    return list(series.values())
@@ -1,14 +1,23 @@
 """
 Ticket service module for handling support tickets
 """
+from datetime import date
 from typing import Dict, List, Optional
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from web.core.models import BaseModel
-from django.db import models
+from django.db import models, transaction
+from . import stats_rollup
 
 User = get_user_model()
 
+STATS_CACHE_KEY = 'core:ticket_stats'
+STATS_CACHE_TTL = 30
+
 class Ticket(BaseModel):
     STATUS_CHOICES = [
         ('open', 'Open'),
@@ -35,17 +44,26 @@ class Ticket(BaseModel):
     class Meta:
         app_label = 'core'
 
+@receiver([post_save, post_delete], sender=Ticket)
+def invalidate_ticket_stats(sender, instance, **kwargs):
+    """
+    Drop the cached ticket stats when a ticket is created, changed or deleted
+    """
+    cache.delete(STATS_CACHE_KEY)
+
 class TicketService:
     def create_ticket(self, data: Dict, user: User) -> Ticket:
         """
         Create a new ticket
         """
-        ticket = Ticket.objects.create(
-            title=data['title'],
-            description=data['description'],
-            priority=data.get('priority', 'medium'),
-            created_by=user
-        )
+        with transaction.atomic():
+            ticket = Ticket.objects.create(
+                title=data['title'],
+                description=data['description'],
+                priority=data.get('priority', 'medium'),
+                created_by=user
+            )
+            stats_rollup.record('tickets_created', ticket.created_at)
         return ticket
 
     def assign_ticket(self, ticket_id: int, user: User) -> Optional[Ticket]:
@@ -66,11 +84,16 @@ class TicketService:
         Update ticket status
         """
         try:
-            ticket = Ticket.objects.get(id=ticket_id)
-            ticket.status = status
-            if status == 'resolved':
-                ticket.resolved_at = timezone.now()
-            ticket.save()
+            with transaction.atomic():
+                ticket = Ticket.objects.select_for_update().get(id=ticket_id)
+                # Only the first resolution counts, resolved_at survives a reopen
+                first_resolution = status == 'resolved' and ticket.resolved_at is None
+                ticket.status = status
+                if status == 'resolved':
+                    ticket.resolved_at = timezone.now()
+                ticket.save()
+                if first_resolution:
+                    stats_rollup.record('tickets_resolved', ticket.resolved_at)
             return ticket
         except Ticket.DoesNotExist:
             return None
@@ -94,19 +117,30 @@ class TicketService:
 
     def get_ticket_stats(self) -> Dict:
         """
-        Get ticket statistics
+        Get ticket statistics, counted in one query and cached briefly
         """
-        total = Ticket.objects.count()
-        open_tickets = Ticket.objects.filter(status='open').count()
-        in_progress = Ticket.objects.filter(status='in_progress').count()
-        resolved = Ticket.objects.filter(status='resolved').count()
-        
-        return {
-            'total': total,
-            'open': open_tickets,
-            'in_progress': in_progress,
-            'resolved': resolved,
-            'resolution_rate': (resolved / total * 100) if total > 0 else 0
+        stats = cache.get(STATS_CACHE_KEY)
+        if stats is not None:
+            return stats
+
+        counts = Ticket.objects.aggregate(
+            total=Count('id'),
+            open=Count('id', filter=Q(status='open')),
+            in_progress=Count('id', filter=Q(status='in_progress')),
+            resolved=Count('id', filter=Q(status='resolved'))
+        )
+        total = counts['total']
+        stats = {
+            **counts,
+            'resolution_rate': (counts['resolved'] / total * 100) if total > 0 else 0
         }
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TTL)
+        return stats
+
+    def get_ticket_stats_by_period(self, period: str = 'day', since: Optional[date] = None) -> List[Dict]:
+        """
+        Get tickets created and resolved per day or week
+        """
+        return stats_rollup.get_series(['tickets_created', 'tickets_resolved'], period, since)
 
 ticket_service = TicketService()
\ No newline at end of file
@@ -1,14 +1,23 @@
 """
 Workflow service module for handling workflow management
 """
+from datetime import date
 from typing import Dict, List, Optional
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from web.core.models import BaseModel
-from django.db import models
+from django.db import models, transaction
+from . import stats_rollup
 
 User = get_user_model()
 
+STATS_CACHE_KEY = 'core:workflow_stats'
+STATS_CACHE_TTL = 30
+
 class Workflow(BaseModel):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -47,27 +56,38 @@ class WorkflowStep(BaseModel):
         app_label = 'core'
         ordering = ['order']
 
+@receiver([post_save, post_delete], sender=Workflow)
+def invalidate_workflow_stats(sender, instance, **kwargs):
+    """
+    Drop the cached workflow stats when a workflow is created, changed or deleted
+    """
+    cache.delete(STATS_CACHE_KEY)
+
 class WorkflowService:
     def create_workflow(self, data: Dict, user: User) -> Workflow:
         """
         Create a new workflow
         """
-        workflow = Workflow.objects.create(
-            name=data['name'],
-            description=data['description'],
-            created_by=user
-        )
-        
-        # Add steps if provided
-        if 'steps' in data:
-            for i, step_data in enumerate(data['steps']):
-                WorkflowStep.objects.create(
-                    workflow=workflow,
-                    name=step_data['name'],
-                    description=step_data.get('description', ''),
-                    order=i + 1,
-                    assigned_to=step_data.get('assigned_to')
-                )
+        with transaction.atomic():
+            workflow = Workflow.objects.create(
+                name=data['name'],
+                description=data['description'],
+                created_by=user
+            )
+            stats_rollup.record('workflows_created', workflow.created_at)
+
+            # Add steps if provided
+            if 'steps' in data:
+                WorkflowStep.objects.bulk_create([
+                    WorkflowStep(
+                        workflow=workflow,
+                        name=step_data['name'],
+                        description=step_data.get('description', ''),
+                        order=i + 1,
+                        assigned_to=step_data.get('assigned_to')
+                    )
+                    for i, step_data in enumerate(data['steps'])
+                ])
 
         return workflow
 
@@ -76,11 +96,16 @@ class WorkflowService:
         Update workflow status
         """
         try:
-            workflow = Workflow.objects.get(id=workflow_id)
-            workflow.status = status
-            if status == 'completed':
-                workflow.completion_date = timezone.now()
-            workflow.save()
+            with transaction.atomic():
+                workflow = Workflow.objects.select_for_update().get(id=workflow_id)
+                # Only the first completion counts, completion_date survives a reopen
+                first_completion = status == 'completed' and workflow.completion_date is None
+                workflow.status = status
+                if status == 'completed':
+                    workflow.completion_date = timezone.now()
+                workflow.save()
+                if first_completion:
+                    stats_rollup.record('workflows_completed', workflow.completion_date)
             return workflow
         except Workflow.DoesNotExist:
             return None
@@ -96,10 +121,11 @@ class WorkflowService:
                 step.completed_at = timezone.now()
             step.save()
 
-            # Check if all steps are completed
-            workflow = step.workflow
-            if all(s.status == 'completed' for s in workflow.steps.all()):
-                self.update_workflow_status(workflow.id, 'completed')
+            # Complete the workflow once no step is left open
+            if status == 'completed' and not WorkflowStep.objects.filter(
+                workflow_id=step.workflow_id
+            ).exclude(status='completed').exists():
+                self.update_workflow_status(step.workflow_id, 'completed')
 
             return step
         except WorkflowStep.DoesNotExist:
@@ -131,17 +157,29 @@ class WorkflowService:
 
     def get_workflow_stats(self) -> Dict:
         """
-        Get workflow statistics
+        Get workflow statistics, counted in one query and cached briefly
         """
-        total = Workflow.objects.count()
-        active = Workflow.objects.filter(status='active').count()
-        completed = Workflow.objects.filter(status='completed').count()
-        
-        return {
-            'total': total,
-            'active': active,
-            'completed': completed,
-            'completion_rate': (completed / total * 100) if total > 0 else 0
+        stats = cache.get(STATS_CACHE_KEY)
+        if stats is not None:
+            return stats
+
+        counts = Workflow.objects.aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(status='active')),
+            completed=Count('id', filter=Q(status='completed'))
+        )
+        total = counts['total']
+        stats = {
+            **counts,
+            'completion_rate': (counts['completed'] / total * 100) if total > 0 else 0
         }
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TTL)
+        return stats
+
+    def get_workflow_stats_by_period(self, period: str = 'day', since: Optional[date] = None) -> List[Dict]:
+        """
+        Get workflows created and completed per day or week
+        """
+        return stats_rollup.get_series(['workflows_created', 'workflows_completed'], period, since)
 
 workflow_service = WorkflowService()
\ No newline at end of file
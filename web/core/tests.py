@@ -0,0 +1,212 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from .services import stats_rollup
+from .services.stats_rollup import StatsRollup
+from .services.ticket_service import ticket_service
+from .services.workflow_service import workflow_service
+from .tickets.dependency_graph import DependencyGraph
+from .workflow.deadline_scheduler import COMPACT_MIN_SIZE, DeadlineScheduler
+
+
+class DependencyGraphTests(SimpleTestCase):
+    def setUp(self):
+        """Set up a -> b -> c -> d and a -> e, each ticket blocked by the next"""
+        self.graph = DependencyGraph()
+        for blocked, blocker in [('a', 'b'), ('b', 'c'), ('c', 'd'), ('a', 'e')]:
+            self.graph.add(blocked, blocker)
+
+    def test_find_cycle(self):
+        """Test a dependency back onto a blocker is reported with its chain"""
+        self.assertEqual(self.graph.find_cycle('d', 'a'), ['d', 'a', 'b', 'c', 'd'])
+        self.assertEqual(self.graph.find_cycle('a', 'a'), ['a', 'a'])
+        self.assertIsNone(self.graph.find_cycle('e', 'd'))
+
+    def test_removed_edge_closes_no_cycle(self):
+        """Test a removed dependency no longer counts"""
+        self.graph.remove('b', 'c')
+        self.assertIsNone(self.graph.find_cycle('d', 'a'))
+        self.assertEqual(self.graph.blockers('a'), {'b', 'e'})
+
+    def test_critical_path(self):
+        """Test the longest chain is found, first blocker first"""
+        self.assertEqual(self.graph.critical_path(), ['d', 'c', 'b', 'a'])
+        self.assertEqual(self.graph.critical_path('b'), ['d', 'c', 'b'])
+
+    def test_critical_path_weights_and_exclude(self):
+        """Test weights decide between chains and excluded tickets are skipped"""
+        self.assertEqual(self.graph.critical_path('a', weights={'e': 5}), ['e', 'a'])
+        self.assertEqual(self.graph.critical_path('a', weights={'b': 2}, exclude=['c', 'd']), ['b', 'a'])
+        self.assertEqual(self.graph.critical_path('z'), ['z'])
+
+
+class DeadlineSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = DeadlineScheduler()
+        self.fired = []
+        self.done = asyncio.Event()
+
+    async def on_deadline(self, key):
+        self.fired.append(key)
+        if key == 'last':
+            self.done.set()
+
+    async def run_until_last(self):
+        """Run the scheduler until the 'last' key fires"""
+        runner = asyncio.create_task(self.scheduler.run(self.on_deadline))
+        try:
+            await asyncio.wait_for(self.done.wait(), timeout=1)
+        finally:
+            runner.cancel()
+
+    async def test_earliest_fires_first(self):
+        """Test deadlines fire in deadline order, not scheduling order"""
+        now = datetime.utcnow()
+        self.scheduler.schedule('last', now - timedelta(seconds=1))
+        self.scheduler.schedule('first', now - timedelta(seconds=3))
+        self.scheduler.schedule('second', now - timedelta(seconds=2))
+        await self.run_until_last()
+        self.assertEqual(self.fired, ['first', 'second', 'last'])
+
+    async def test_reschedule_and_cancel(self):
+        """Test a rescheduled or cancelled key does not fire at its old deadline"""
+        now = datetime.utcnow()
+        self.scheduler.schedule('moved', now - timedelta(seconds=3))
+        self.scheduler.schedule('moved', now + timedelta(hours=1))
+        self.scheduler.schedule('cancelled', now - timedelta(seconds=2))
+        self.scheduler.cancel('cancelled')
+        self.scheduler.schedule('cleared', now - timedelta(seconds=2))
+        self.scheduler.schedule('cleared', None)
+        self.scheduler.schedule('last', now - timedelta(seconds=1))
+        await self.run_until_last()
+        self.assertEqual(self.fired, ['last'])
+
+    async def test_earlier_deadline_wakes_runner(self):
+        """Test the runner does not sleep until a later deadline once an earlier one is scheduled"""
+        self.scheduler.schedule('later', datetime.utcnow() + timedelta(hours=1))
+        runner = asyncio.create_task(self.scheduler.run(self.on_deadline))
+        try:
+            # Let the runner go to sleep on the later deadline
+            await asyncio.sleep(0.01)
+            self.scheduler.schedule('last', datetime.utcnow())
+            await asyncio.wait_for(self.done.wait(), timeout=1)
+        finally:
+            runner.cancel()
+        self.assertEqual(self.fired, ['last'])
+
+    def test_compaction(self):
+        """Test rescheduling a key over and over does not grow the heap"""
+        now = datetime.utcnow()
+        for seconds in range(1000):
+            self.scheduler.schedule('key', now + timedelta(seconds=seconds))
+        self.assertLessEqual(len(self.scheduler._heap), COMPACT_MIN_SIZE)
+        self.assertIn((now + timedelta(seconds=999), self.scheduler._sequences['key'], 'key'), self.scheduler._heap)
+
+
+class StatsRollupTests(TestCase):
+    def setUp(self):
+        """Set up a ticket that is resolved, reopened and resolved again"""
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='stats', password='testpass123')
+        self.ticket = ticket_service.create_ticket({'title': 'Broken', 'description': 'It broke'}, self.user)
+        for status in ('resolved', 'open', 'resolved'):
+            ticket_service.update_status(self.ticket.id, status)
+
+    def counts(self):
+        return dict(StatsRollup.objects.values_list('metric', 'count'))
+
+    def test_first_resolution_counts_once(self):
+        """Test re-resolving a reopened ticket is not counted again"""
+        self.assertEqual(self.counts(), {'tickets_created': 1, 'tickets_resolved': 1})
+
+    def test_backfill(self):
+        """Test the rollup is rebuilt from existing rows and re-running changes nothing"""
+        workflow_service.create_workflow({'name': 'Release', 'description': 'Ship it', 'steps': []}, self.user)
+        StatsRollup.objects.all().delete()
+        for _ in range(2):
+            call_command('backfill_stats_rollup', stdout=StringIO())
+        self.assertEqual(self.counts(), {'tickets_created': 1, 'tickets_resolved': 1, 'workflows_created': 1})
+
+    def test_series_by_week(self):
+        """Test days are summed into their week and missing metrics read as zero"""
+        for metric, day, count in [
+            ('opened', date(2024, 1, 1), 2),
+            ('opened', date(2024, 1, 3), 3),
+            ('closed', date(2024, 1, 7), 1),
+            ('opened', date(2024, 1, 10), 4),
+        ]:
+            StatsRollup.objects.create(metric=metric, day=day, count=count)
+
+        self.assertEqual(stats_rollup.get_series(['opened', 'closed'], 'week', since=date(2024, 1, 2)), [
+            {'period': date(2024, 1, 1), 'opened': 3, 'closed': 1},
+            {'period': date(2024, 1, 8), 'opened': 4, 'closed': 0},
+        ])
+        self.assertEqual(stats_rollup.get_series(['closed'], 'day'), [
+            {'period': date(2024, 1, 7), 'closed': 1},
+        ])
+        with self.assertRaises(ValueError):
+            stats_rollup.get_series(['opened'], 'month')
+
+    def test_stats_by_period(self):
+        """Test the service series read the rollup of their own metrics"""
+        workflow_service.create_workflow({'name': 'Release', 'description': 'Ship it', 'steps': []}, self.user)
+        today = timezone.localdate()
+        self.assertEqual(ticket_service.get_ticket_stats_by_period(), [
+            {'period': today, 'tickets_created': 1, 'tickets_resolved': 1},
+        ])
+        self.assertEqual(workflow_service.get_workflow_stats_by_period('week', since=today), [
+            {'period': today - timedelta(days=today.weekday()), 'workflows_created': 1, 'workflows_completed': 0},
+        ])
+
+    def test_ticket_stats_cached_until_changed(self):
+        """Test ticket stats take one query, are then cached and are dropped on a write"""
+        with self.assertNumQueries(1):
+            stats = ticket_service.get_ticket_stats()
+        self.assertEqual(stats, {'total': 1, 'open': 0, 'in_progress': 0, 'resolved': 1, 'resolution_rate': 100.0})
+        with self.assertNumQueries(0):
+            ticket_service.get_ticket_stats()
+
+        ticket_service.create_ticket({'title': 'Slow', 'description': 'It is slow'}, self.user)
+        self.assertEqual(ticket_service.get_ticket_stats()['open'], 1)
+        self.assertEqual(ticket_service.get_ticket_stats()['resolution_rate'], 50.0)
+
+    def test_workflow_stats_cached_until_changed(self):
+        """Test workflow stats take one query, are then cached and are dropped on a write"""
+        with self.assertNumQueries(1):
+            self.assertEqual(workflow_service.get_workflow_stats()['total'], 0)
+        with self.assertNumQueries(0):
+            workflow_service.get_workflow_stats()
+
+        workflow = workflow_service.create_workflow({'name': 'Release', 'description': 'Ship it'}, self.user)
+        self.assertEqual(workflow_service.get_workflow_stats()['total'], 1)
+        workflow_service.update_workflow_status(workflow.id, 'completed')
+        self.assertEqual(
+            workflow_service.get_workflow_stats(),
+            {'total': 1, 'active': 0, 'completed': 1, 'completion_rate': 100.0}
+        )
+
+    def test_last_step_completes_workflow_once(self):
+        """Test completing the last open step completes the workflow and counts it once"""
+        workflow = workflow_service.create_workflow({
+            'name': 'Release',
+            'description': 'Ship it',
+            'steps': [{'name': 'Build'}, {'name': 'Deploy'}]
+        }, self.user)
+        build, deploy = workflow.steps.all()
+        self.assertEqual((build.order, deploy.order), (1, 2))
+
+        workflow_service.update_step_status(build.id, 'completed', self.user)
+        workflow.refresh_from_db()
+        self.assertEqual(workflow.status, 'pending')
+
+        for _ in range(2):
+            workflow_service.update_step_status(deploy.id, 'completed', self.user)
+        workflow.refresh_from_db()
+        self.assertEqual(workflow.status, 'completed')
+        self.assertIsNotNone(workflow.completion_date)
+        self.assertEqual(self.counts()['workflows_completed'], 1)
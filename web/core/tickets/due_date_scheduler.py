@@ -0,0 +1,246 @@
+"""
+Due date events for open tickets.
+
+The scheduler keeps a min-heap of upcoming due-soon and overdue events and
+sleeps until the earliest one, so events fire when they occur instead of
+being found by a periodic scan. It is filled once from the partial due date
+index on open tickets (sql/001_ticket_stats.sql) and kept in sync by
+TicketManager and the bulk import on every write. Only the process running
+the scheduler keeps a heap. When REDIS_URL is set every write is appended to a
+Redis stream that the scheduler follows, so writes made by any process are
+scheduled as they happen; without Redis, writes made outside the bot process
+are only reconciled when their old event fires or on the next start. A ticket
+written when it is already inside the due-soon window gets its due-soon event
+right away. Rescheduled or closed tickets leave their old heap entries
+behind; those are recognised and skipped when popped.
+"""
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from utils.logger import logger
+from database.supabase_client import db
+from .redis_client import redis
+from .ticket_types import TicketStatus
+
+DUE_SOON = 'due_soon'
+OVERDUE = 'overdue'
+CLOSED_STATUSES = {TicketStatus.COMPLETED.value, TicketStatus.CLOSED.value}
+LOAD_PAGE_SIZE = 1000
+STREAM_KEY = 'tickets:due_dates'
+STREAM_MAX_LENGTH = 10000
+
+OnEvent = Callable[[str, str], Awaitable[None]]
+
+
+def _parse_due_date(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        due_date = value
+    else:
+        due_date = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if due_date is not None and due_date.tzinfo is None:
+        due_date = due_date.replace(tzinfo=timezone.utc)
+    return due_date
+
+
+class DueDateScheduler:
+    def __init__(self, due_soon_window: timedelta = timedelta(hours=24)):
+        self.db = db
+        self.due_soon_window = due_soon_window
+        # (fires_at, schedule sequence, ticket_id, event)
+        self._heap: List[Tuple[datetime, int, str, str]] = []
+        # ticket_id -> (due_date, sequence of its current heap entries)
+        self._schedule: Dict[str, Tuple[datetime, int]] = {}
+        self._sequence = itertools.count()
+        self.overdue: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._redis = redis
+        self._stream_id = '$'
+        self._running = False
+
+    @property
+    def wakeup(self) -> asyncio.Event:
+        # Created lazily so it binds to the bot's running loop
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    async def record(self, tickets: List[Dict]) -> None:
+        """Announce written tickets to the scheduler, whichever process wrote them"""
+        if self._redis is None:
+            for ticket in tickets:
+                self.track(ticket)
+            return
+        try:
+            # The scheduler applies these in stream order, its own writes included
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for ticket in tickets:
+                    status = ticket.get('status')
+                    due_date = _parse_due_date(ticket.get('due_date'))
+                    pipe.xadd(
+                        STREAM_KEY,
+                        {
+                            'id': str(ticket['id']),
+                            'status': str(getattr(status, 'value', status) or ''),
+                            'due_date': due_date.isoformat() if due_date else ''
+                        },
+                        maxlen=STREAM_MAX_LENGTH,
+                        approximate=True
+                    )
+                await pipe.execute()
+        except Exception as e:
+            # Reconciled when the old event fires or on the next start
+            logger.error(f"Failed to publish ticket due dates: {str(e)}")
+            for ticket in tickets:
+                self.track(ticket)
+
+    def track(self, ticket: Dict, warn_late: bool = True) -> None:
+        """
+        Schedule, reschedule or drop a ticket in this process.
+        A ticket already inside the due-soon window gets its due-soon event
+        right away unless warn_late is False.
+        """
+        if not self._running:
+            # Nothing pops the heap in this process
+            return
+        ticket_id = str(ticket['id'])
+        status = ticket.get('status')
+        status = getattr(status, 'value', status)
+        due_date = _parse_due_date(ticket.get('due_date'))
+
+        if status in CLOSED_STATUSES or due_date is None:
+            self._schedule.pop(ticket_id, None)
+            self.overdue.discard(ticket_id)
+            return
+        if ticket_id in self._schedule and self._schedule[ticket_id][0] == due_date:
+            return
+
+        sequence = next(self._sequence)
+        self._schedule[ticket_id] = (due_date, sequence)
+        self.overdue.discard(ticket_id)
+        now = datetime.now(timezone.utc)
+        earliest = self._heap[0][0] if self._heap else None
+        for fires_at, event in ((due_date - self.due_soon_window, DUE_SOON), (due_date, OVERDUE)):
+            if event == DUE_SOON and fires_at <= now:
+                if not warn_late or due_date <= now:
+                    continue
+                fires_at = now
+            heapq.heappush(self._heap, (fires_at, sequence, ticket_id, event))
+
+        if earliest is None or self._heap[0][0] < earliest:
+            self.wakeup.set()
+
+    def is_scheduled(self, ticket: Dict) -> bool:
+        """Check a stored ticket still has the due date its events were scheduled for"""
+        scheduled = self._schedule.get(str(ticket['id']))
+        return scheduled is not None and scheduled[0] == _parse_due_date(ticket.get('due_date'))
+
+    async def load(self) -> None:
+        """Fill the schedule from the open tickets that have a due date"""
+        try:
+            now = datetime.now(timezone.utc)
+            offset = 0
+            while True:
+                response = await self.db.table('tickets').select(
+                    'id, status, due_date'
+                ).not_.is_('due_date', 'null').not_.in_(
+                    'status', list(CLOSED_STATUSES)
+                ).order('due_date').order('id').range(
+                    offset, offset + LOAD_PAGE_SIZE - 1
+                ).execute()
+
+                for ticket in response.data:
+                    due_date = _parse_due_date(ticket['due_date'])
+                    if due_date <= now:
+                        # Went overdue before this start, no event to fire
+                        self._schedule[ticket['id']] = (due_date, next(self._sequence))
+                        self.overdue.add(ticket['id'])
+                    else:
+                        # Due-soon events inside the window fired before this start
+                        self.track(ticket, warn_late=False)
+                if len(response.data) < LOAD_PAGE_SIZE:
+                    break
+                offset += LOAD_PAGE_SIZE
+
+            logger.info(f"Scheduled due dates of {len(self._schedule)} open tickets")
+
+        except Exception as e:
+            logger.error(f"Failed to load ticket due dates: {str(e)}")
+            raise
+
+    async def run(self, on_event: OnEvent) -> None:
+        """Fire due-soon and overdue events as they occur until cancelled"""
+        self._running = True
+        try:
+            await self._run(on_event)
+        finally:
+            self._running = False
+
+    async def _run(self, on_event: OnEvent) -> None:
+        if self._redis is not None:
+            # Writes made while loading are applied again afterwards
+            latest = await self._redis.xrevrange(STREAM_KEY, count=1)
+            self._stream_id = latest[0][0] if latest else '0-0'
+        await self.load()
+        follower = asyncio.create_task(self._follow()) if self._redis is not None else None
+        try:
+            await self._fire(on_event)
+        finally:
+            if follower is not None:
+                follower.cancel()
+
+    async def _follow(self) -> None:
+        """Track the writes announced on the stream until cancelled"""
+        while True:
+            try:
+                response = await self._redis.xread(
+                    {STREAM_KEY: self._stream_id},
+                    count=LOAD_PAGE_SIZE,
+                    block=0
+                )
+                for stream_id, fields in response[0][1] if response else []:
+                    self.track({
+                        'id': fields[b'id'].decode(),
+                        'status': fields[b'status'].decode() or None,
+                        'due_date': fields[b'due_date'].decode() or None
+                    })
+                    self._stream_id = stream_id
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading ticket due dates: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _fire(self, on_event: OnEvent) -> None:
+        while True:
+            self.wakeup.clear()
+            delay = None
+            if self._heap:
+                delay = (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+
+            if delay is None or delay > 0:
+                try:
+                    # Woken early when an earlier event is scheduled
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, sequence, ticket_id, event = heapq.heappop(self._heap)
+            if ticket_id not in self._schedule or self._schedule[ticket_id][1] != sequence:
+                # Closed or rescheduled since this entry was pushed
+                continue
+            if event == OVERDUE:
+                self.overdue.add(ticket_id)
+
+            try:
+                await on_event(ticket_id, event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to handle {event} event of ticket {ticket_id}: {str(e)}")
+
+
+# Initialize due date scheduler
+due_date_scheduler = DueDateScheduler()
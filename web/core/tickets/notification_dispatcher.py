@@ -0,0 +1,188 @@
+"""
+Push delivery of ticket notifications.
+
+TicketManager publishes every notification right after storing it. Within
+the bot process they go onto an asyncio queue; when REDIS_URL is set they are
+appended to a Redis stream instead, so notifications created by any process
+reach the bot. Without Redis, processes that do not run the dispatcher only
+store them and the bot picks them up from the table on its next start.
+
+The dispatcher waits for the first notification, collects whatever else
+arrives within a short window, hands each user's batch to the delivery
+callback as one message and marks the whole batch read with a single update.
+Notifications stored while the bot was offline are caught up from the table
+on start, and batches that fail to deliver are retried with a backoff.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from utils.logger import logger
+from database.supabase_client import db
+from .redis_client import redis
+
+STREAM_KEY = 'tickets:notifications'
+STREAM_MAX_LENGTH = 10000
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 300
+MAX_RETRIES = 10
+
+Deliver = Callable[[str, List[Dict]], Awaitable[None]]
+
+
+class NotificationDispatcher:
+    def __init__(self, batch_window: float = 0.5, max_batch: int = 100):
+        self.db = db
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._redis = redis
+        self._stream_id = '$'
+        self._running = False
+        self._retries: Set[asyncio.Task] = set()
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created lazily so it binds to the bot's running loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def publish(self, notifications: List[Dict]) -> None:
+        """Hand stored notifications to the dispatcher"""
+        if not notifications:
+            return
+        try:
+            if self._redis is None:
+                if not self._running:
+                    # Nothing here would drain the queue, the stored rows are
+                    # caught up when the bot starts
+                    return
+                for notification in notifications:
+                    self.queue.put_nowait(notification)
+                return
+
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for notification in notifications:
+                    pipe.xadd(
+                        STREAM_KEY,
+                        {'notification': json.dumps(notification, default=str)},
+                        maxlen=STREAM_MAX_LENGTH,
+                        approximate=True
+                    )
+                await pipe.execute()
+
+        except Exception as e:
+            # Still stored unread, the next start catches them up
+            logger.error(f"Failed to publish ticket notifications: {str(e)}")
+
+    async def run(self, deliver: Deliver) -> None:
+        """Deliver notifications as they arrive until cancelled"""
+        # Set before the catch-up so nothing published meanwhile is missed
+        self._running = True
+        try:
+            if self._redis is not None:
+                # Only entries added after this point are read from the stream,
+                # everything older is still unread in the table
+                self._stream_id = await self._latest_stream_id()
+
+            backlog = await self.db.table('ticket_notifications').select(
+                'id, ticket_id, user_id, type, message, created_at'
+            ).eq('read', False).order('created_at').execute()
+            caught_up = {notification['id'] for notification in backlog.data}
+            if backlog.data:
+                await self._dispatch(backlog.data, deliver)
+
+            while True:
+                try:
+                    batch = [
+                        notification for notification in await self._next_batch()
+                        if notification['id'] not in caught_up
+                    ]
+                    if batch:
+                        await self._dispatch(batch, deliver)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error dispatching ticket notifications: {str(e)}")
+                    await asyncio.sleep(1)
+
+        finally:
+            self._running = False
+            for task in self._retries:
+                task.cancel()
+
+    async def _dispatch(self, notifications: List[Dict], deliver: Deliver, attempt: int = 0) -> None:
+        by_user: Dict[str, List[Dict]] = defaultdict(list)
+        for notification in notifications:
+            by_user[notification['user_id']].append(notification)
+
+        delivered = []
+        failed = []
+        for user_id, user_notifications in by_user.items():
+            try:
+                await deliver(user_id, user_notifications)
+                delivered.extend(notification['id'] for notification in user_notifications)
+            except Exception as e:
+                logger.error(f"Failed to deliver notifications to {user_id}: {str(e)}")
+                failed.extend(user_notifications)
+
+        if failed:
+            if attempt < MAX_RETRIES:
+                delay = min(RETRY_DELAY * 2 ** attempt, MAX_RETRY_DELAY)
+                task = asyncio.create_task(self._retry(failed, deliver, attempt + 1, delay))
+                self._retries.add(task)
+                task.add_done_callback(self._retries.discard)
+            else:
+                # Left unread, the next start catches them up
+                logger.error(f"Giving up on {len(failed)} ticket notifications after {attempt} retries")
+
+        if delivered:
+            await self.db.table('ticket_notifications').update(
+                {'read': True}
+            ).in_('id', delivered).execute()
+            logger.info(f"Delivered {len(delivered)} ticket notifications to {len(by_user)} users")
+
+    async def _retry(self, notifications: List[Dict], deliver: Deliver, attempt: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self._dispatch(notifications, deliver, attempt)
+        except Exception as e:
+            logger.error(f"Error retrying ticket notifications: {str(e)}")
+
+    async def _next_batch(self) -> List[Dict]:
+        if self._redis is not None:
+            return await self._read_stream()
+
+        batch = [await self.queue.get()]
+        await asyncio.sleep(self.batch_window)
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _read_stream(self) -> List[Dict]:
+        # Block for the first entry, then let the window fill up
+        entries = await self._xread(block=0)
+        await asyncio.sleep(self.batch_window)
+        if len(entries) < self.max_batch:
+            entries += await self._xread(count=self.max_batch - len(entries))
+        return [json.loads(fields[b'notification']) for _, fields in entries]
+
+    async def _xread(self, count: Optional[int] = None, block: Optional[int] = None) -> List:
+        response = await self._redis.xread(
+            {STREAM_KEY: self._stream_id},
+            count=count or self.max_batch,
+            block=block
+        )
+        entries = response[0][1] if response else []
+        if entries:
+            self._stream_id = entries[-1][0]
+        return entries
+
+    async def _latest_stream_id(self) -> str:
+        latest = await self._redis.xrevrange(STREAM_KEY, count=1)
+        return latest[0][0] if latest else '0-0'
+
+
+# Initialize notification dispatcher
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,17 @@
+"""
+Shared Redis connection for the ticket services.
+
+``redis`` is None when REDIS_URL is not configured; callers then keep their
+state in-process.
+"""
+from typing import Tuple
+from redis import asyncio as aioredis
+from config import settings
+
+redis = aioredis.from_url(settings.REDIS_URL) if settings.REDIS_URL else None
+
+
+def stream_position(stream_id: str) -> Tuple[int, int]:
+    """Get a comparable (milliseconds, sequence) pair from a stream entry ID"""
+    milliseconds, _, sequence = stream_id.partition('-')
+    return int(milliseconds), int(sequence or 0)
@@ -0,0 +1,96 @@
+-- Incrementally maintained ticket statistics.
+--
+-- A trigger on tickets keeps one counter row per (dimension, value), so the
+-- ticket report reads a handful of rows instead of scanning every ticket.
+-- Overdue tickets depend on the current time and are counted at read time
+-- through the partial due date index below.
+
+begin;
+
+create table if not exists ticket_stats (
+    dimension text not null,
+    value text not null,
+    count bigint not null default 0,
+    total_hours double precision not null default 0,
+    primary key (dimension, value)
+);
+
+create or replace function apply_ticket_stats(t tickets, delta integer)
+returns void
+language plpgsql
+as $$
+begin
+    insert into ticket_stats (dimension, value, count)
+    values
+        ('total', 'all', delta),
+        ('status', t.status, delta),
+        ('priority', t.priority, delta),
+        ('type', t.type, delta)
+    on conflict (dimension, value)
+    do update set count = ticket_stats.count + excluded.count;
+
+    if t.status = 'completed' then
+        insert into ticket_stats (dimension, value, count, total_hours)
+        values (
+            'completion',
+            'all',
+            delta,
+            delta * extract(epoch from (coalesce(t.updated_at, t.created_at) - t.created_at)) / 3600
+        )
+        on conflict (dimension, value)
+        do update set
+            count = ticket_stats.count + excluded.count,
+            total_hours = ticket_stats.total_hours + excluded.total_hours;
+    end if;
+end;
+$$;
+
+create or replace function ticket_stats_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform apply_ticket_stats(old, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform apply_ticket_stats(new, 1);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists tickets_stats on tickets;
+create trigger tickets_stats
+    after insert or delete or update of status, priority, type, created_at, updated_at
+    on tickets
+    for each row
+    execute function ticket_stats_trigger();
+
+-- Overdue count at report time
+create index if not exists tickets_open_due_date_idx
+    on tickets (due_date)
+    where status not in ('completed', 'closed');
+
+-- Backfill from the existing tickets, blocking writes until the trigger is live
+lock table tickets in share row exclusive mode;
+truncate ticket_stats;
+insert into ticket_stats (dimension, value, count)
+select 'total', 'all', count(*) from tickets
+union all
+select 'status', status, count(*) from tickets group by status
+union all
+select 'priority', priority, count(*) from tickets group by priority
+union all
+select 'type', type, count(*) from tickets group by type;
+
+insert into ticket_stats (dimension, value, count, total_hours)
+select
+    'completion',
+    'all',
+    count(*),
+    coalesce(sum(extract(epoch from (coalesce(updated_at, created_at) - created_at)) / 3600), 0)
+from tickets
+where status = 'completed';
+
+commit;
@@ -0,0 +1,128 @@
+-- Single round-trip ticket updates.
+--
+-- update_ticket diffs the requested changes against the locked row, writes
+-- only the changed columns, bulk-inserts one audit row per changed field and
+-- notifies the assignees, all in one transaction. The version column gives
+-- callers optimistic concurrency: pass the version that was read and the
+-- update fails with SQLSTATE 40001 if someone else wrote in between.
+
+begin;
+
+alter table tickets add column if not exists version integer not null default 1;
+alter table ticket_updates add column if not exists ticket_id text;
+
+create index if not exists ticket_updates_ticket_id_idx on ticket_updates (ticket_id);
+
+create or replace function update_ticket(
+    p_ticket_id text,
+    p_changes jsonb,
+    p_updated_by text,
+    p_expected_version integer default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    -- The parameter cast to the key's type once, so the primary key index is used
+    ticket_key tickets.id%type;
+    current_row tickets;
+    current_json jsonb;
+    changed jsonb := '{}'::jsonb;
+    updated_row tickets;
+    field text;
+    summary text;
+    notifications jsonb;
+begin
+    begin
+        ticket_key := p_ticket_id;
+    exception when invalid_text_representation then
+        raise exception 'Ticket % not found', p_ticket_id using errcode = 'P0002';
+    end;
+
+    select * into current_row from tickets where id = ticket_key for update;
+    if not found then
+        raise exception 'Ticket % not found', p_ticket_id using errcode = 'P0002';
+    end if;
+
+    if p_expected_version is not null and current_row.version <> p_expected_version then
+        raise exception 'Ticket % was modified concurrently', p_ticket_id using errcode = '40001';
+    end if;
+
+    -- Keep only the fields whose value actually changes
+    current_json := to_jsonb(current_row);
+    for field in select jsonb_object_keys(p_changes) loop
+        if field in ('id', 'version', 'created_at', 'updated_at') or not current_json ? field then
+            raise exception 'Field % cannot be updated', field using errcode = '22023';
+        end if;
+        if current_json -> field is distinct from p_changes -> field then
+            changed := changed || jsonb_build_object(field, p_changes -> field);
+        end if;
+    end loop;
+
+    if changed = '{}'::jsonb then
+        return jsonb_build_object('ticket', current_json, 'changes', '[]'::jsonb, 'notifications', '[]'::jsonb);
+    end if;
+
+    updated_row := jsonb_populate_record(
+        current_row,
+        changed || jsonb_build_object('updated_at', now(), 'version', current_row.version + 1)
+    );
+
+    -- Write only the changed columns
+    execute format(
+        'update tickets set %s where id = ($1).id',
+        (
+            select string_agg(format('%I = ($1).%I', key, key), ', ')
+            from jsonb_object_keys(changed || '{"updated_at": null, "version": null}'::jsonb) as key
+        )
+    ) using updated_row;
+
+    insert into ticket_updates (ticket_id, field, old_value, new_value, updated_by, updated_at)
+    select
+        p_ticket_id,
+        key,
+        nullif(current_json ->> key, ''),
+        changed ->> key,
+        p_updated_by,
+        updated_row.updated_at
+    from jsonb_object_keys(changed) as key;
+
+    select string_agg(
+        format('%s: %s → %s', key, coalesce(current_json ->> key, 'None'), changed ->> key),
+        ', '
+    )
+    into summary
+    from jsonb_object_keys(changed) as key;
+
+    -- Returned so the caller can push them to the notification dispatcher
+    with inserted as (
+        insert into ticket_notifications (id, ticket_id, user_id, type, message, created_at, read)
+        select
+            gen_random_uuid()::text,
+            p_ticket_id,
+            assignee ->> 'user_id',
+            'update',
+            format('Ticket #%s was updated: %s', p_ticket_id, summary),
+            updated_row.updated_at,
+            false
+        from jsonb_array_elements(coalesce(to_jsonb(updated_row.assignees), '[]'::jsonb)) as assignee
+        returning *
+    )
+    select coalesce(jsonb_agg(to_jsonb(inserted)), '[]'::jsonb) into notifications from inserted;
+
+    return jsonb_build_object(
+        'ticket', to_jsonb(updated_row),
+        'changes', (
+            select jsonb_agg(jsonb_build_object(
+                'field', key,
+                'old_value', current_json -> key,
+                'new_value', changed -> key
+            ))
+            from jsonb_object_keys(changed) as key
+        ),
+        'notifications', notifications
+    );
+end;
+$$;
+
+commit;
@@ -0,0 +1,14 @@
+-- Indexes for paginated ticket listing.
+--
+-- Listings are ordered newest first and paged with a (created_at, id)
+-- keyset. Assignee filters use JSONB containment (assignees @> '[{"user_id": ...}]'),
+-- which the GIN index answers without scanning every ticket.
+
+create index if not exists tickets_created_at_id_idx
+    on tickets (created_at desc, id desc);
+
+create index if not exists tickets_status_created_at_id_idx
+    on tickets (status, created_at desc, id desc);
+
+create index if not exists tickets_assignees_gin_idx
+    on tickets using gin (assignees jsonb_path_ops);
@@ -0,0 +1,112 @@
+-- Ticket relation graph.
+--
+-- Relations move out of each ticket's JSON relations list into an adjacency
+-- table, one row per edge. ticket_dependencies normalizes blocks/blocked_by
+-- rows into (blocked, blocker) pairs for graph queries. add_ticket_relation
+-- inserts an edge and, for dependencies, rejects it with SQLSTATE 23514 if
+-- it would close a cycle; dependency inserts are serialized so two
+-- concurrent inserts cannot close one together.
+
+begin;
+
+create table if not exists ticket_relations (
+    ticket_id text not null,
+    related_ticket_id text not null,
+    relation_type text not null,
+    created_at timestamptz not null default now(),
+    primary key (ticket_id, related_ticket_id, relation_type),
+    check (ticket_id <> related_ticket_id)
+);
+
+create index if not exists ticket_relations_related_ticket_id_idx
+    on ticket_relations (related_ticket_id, relation_type);
+
+create or replace view ticket_dependencies as
+    select ticket_id as blocked, related_ticket_id as blocker
+    from ticket_relations
+    where relation_type = 'blocked_by'
+    union all
+    select related_ticket_id as blocked, ticket_id as blocker
+    from ticket_relations
+    where relation_type = 'blocks';
+
+create or replace function add_ticket_relation(
+    p_ticket_id text,
+    p_related_ticket_id text,
+    p_relation_type text
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    -- The parameters cast to the key's type once, so the primary key index is used
+    ticket_key tickets.id%type;
+    related_key tickets.id%type;
+    blocked text;
+    blocker text;
+    created boolean;
+begin
+    if p_ticket_id = p_related_ticket_id then
+        raise exception 'Ticket % cannot be related to itself', p_ticket_id using errcode = '22023';
+    end if;
+
+    begin
+        ticket_key := p_ticket_id;
+        related_key := p_related_ticket_id;
+    exception when invalid_text_representation then
+        raise exception 'Ticket % or % not found', p_ticket_id, p_related_ticket_id using errcode = 'P0002';
+    end;
+
+    if (select count(*) from tickets where id in (ticket_key, related_key)) < 2 then
+        raise exception 'Ticket % or % not found', p_ticket_id, p_related_ticket_id using errcode = 'P0002';
+    end if;
+
+    if p_relation_type in ('blocks', 'blocked_by') then
+        perform pg_advisory_xact_lock(hashtext('ticket_dependencies'));
+
+        if p_relation_type = 'blocked_by' then
+            blocked := p_ticket_id;
+            blocker := p_related_ticket_id;
+        else
+            blocked := p_related_ticket_id;
+            blocker := p_ticket_id;
+        end if;
+
+        -- A cycle closes if the new blocker is already (transitively) blocked by the ticket
+        if exists (
+            with recursive blockers(id) as (
+                select blocker
+                union
+                select d.blocker
+                from ticket_dependencies d
+                join blockers b on d.blocked = b.id
+            )
+            select 1 from blockers where id = blocked
+        ) then
+            raise exception 'Ticket % is already blocked by %', blocker, blocked using errcode = '23514';
+        end if;
+    end if;
+
+    insert into ticket_relations (ticket_id, related_ticket_id, relation_type)
+    values (p_ticket_id, p_related_ticket_id, p_relation_type)
+    on conflict do nothing;
+    created := found;
+
+    return jsonb_build_object('created', created);
+end;
+$$;
+
+-- Backfill from the JSON relations lists
+insert into ticket_relations (ticket_id, related_ticket_id, relation_type, created_at)
+select
+    t.id::text,
+    relation ->> 'ticket_id',
+    relation ->> 'relation_type',
+    coalesce((relation ->> 'created_at')::timestamptz, now())
+from tickets t,
+    jsonb_array_elements(coalesce(to_jsonb(t.relations), '[]'::jsonb)) as relation
+where relation ->> 'ticket_id' is not null
+    and relation ->> 'ticket_id' <> t.id::text
+on conflict do nothing;
+
+commit;
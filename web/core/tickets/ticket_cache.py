@@ -0,0 +1,134 @@
+"""
+Read-through cache of ticket rows keyed by ID.
+
+Entries live in a bounded in-process LRU with a TTL. When REDIS_URL is set a
+shared tier holds the latest cached version of every ticket, and local hits
+are only served if they match that version, so a write in one process is not
+read stale in another. Every TicketManager write stores the new row, which
+carries its bumped ``version``; a cache fill never replaces a newer version,
+so a read racing a write cannot put the old row back.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from config import settings
+from utils.logger import logger
+from .redis_client import redis
+
+# Store the ticket unless the shared tier already has the same or a newer version
+STORE_IF_NEWER = """
+local current = redis.call('HGET', KEYS[1], 'version')
+if current and tonumber(current) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'version', ARGV[1], 'ticket', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def _cache_key(ticket_id: str) -> str:
+    return f"tickets:cache:{ticket_id}"
+
+
+class TicketCache:
+    def __init__(self, max_size: int = 1000, ttl: int = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._redis = redis
+        self._store_if_newer = redis.register_script(STORE_IF_NEWER) if redis is not None else None
+        # ticket_id -> (expires_at, version, serialized ticket)
+        self._local: "OrderedDict[str, Tuple[float, int, str]]" = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    async def get(self, ticket_id: str) -> Optional[Dict]:
+        """Get a cached ticket, or None on a miss"""
+        entry = self._get_local(ticket_id)
+        try:
+            if self._redis is None:
+                if entry is not None:
+                    self.hits += 1
+                    return json.loads(entry[2])
+                self.misses += 1
+                return None
+
+            if entry is not None:
+                version = await self._redis.hget(_cache_key(ticket_id), 'version')
+                if version is not None and int(version) == entry[1]:
+                    self.hits += 1
+                    return json.loads(entry[2])
+
+            version, serialized = await self._redis.hmget(_cache_key(ticket_id), 'version', 'ticket')
+            if serialized is not None:
+                self.shared_hits += 1
+                self._put_local(ticket_id, int(version), serialized.decode())
+                return json.loads(serialized)
+
+        except Exception as e:
+            # The cache must never fail a read, fall back to the database
+            logger.error(f"Failed to read ticket {ticket_id} from cache: {str(e)}")
+
+        self.misses += 1
+        return None
+
+    async def put(self, ticket: Dict) -> None:
+        """Cache a ticket row unless a newer version is already cached"""
+        ticket_id = str(ticket['id'])
+        version = int(ticket.get('version') or 1)
+        serialized = json.dumps(ticket, default=str)
+
+        entry = self._get_local(ticket_id)
+        if entry is None or entry[1] <= version:
+            self._put_local(ticket_id, version, serialized)
+
+        if self._redis is not None:
+            try:
+                await self._store_if_newer(keys=[_cache_key(ticket_id)], args=[version, serialized, self.ttl])
+            except Exception as e:
+                logger.error(f"Failed to cache ticket {ticket_id}: {str(e)}")
+
+    async def invalidate(self, ticket_id: str) -> None:
+        """Drop a ticket from every tier"""
+        self._local.pop(str(ticket_id), None)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(_cache_key(ticket_id))
+            except Exception as e:
+                logger.error(f"Failed to invalidate cached ticket {ticket_id}: {str(e)}")
+
+    def stats(self) -> Dict:
+        """Get hit-rate metrics"""
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'size': len(self._local),
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0
+        }
+
+    def _get_local(self, ticket_id: str) -> Optional[Tuple[float, int, str]]:
+        entry = self._local.get(ticket_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._local[ticket_id]
+            return None
+        self._local.move_to_end(ticket_id)
+        return entry
+
+    def _put_local(self, ticket_id: str, version: int, serialized: str) -> None:
+        self._local[ticket_id] = (time.monotonic() + self.ttl, version, serialized)
+        self._local.move_to_end(ticket_id)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+
+# Initialize ticket cache
+ticket_cache = TicketCache(
+    max_size=settings.TICKET_CACHE_SIZE,
+    ttl=settings.TICKET_CACHE_TTL
+)
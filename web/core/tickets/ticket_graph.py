@@ -0,0 +1,129 @@
+"""
+In-memory index of ticket dependencies.
+
+Loaded from the ticket_dependencies view (sql/004_ticket_relations.sql) and
+kept current by TicketManager.add_relation and remove_relation. When
+REDIS_URL is set every edge change is also appended to a Redis stream, and
+each use first applies the changes other processes made since; without Redis
+the index is reloaded once it is older than TICKET_CACHE_TTL. The database
+function re-checks for cycles either way, so a stale index can delay a
+rejection but not let a cycle in.
+"""
+import asyncio
+import time
+from typing import Optional
+from config import settings
+from utils.logger import logger
+from database.supabase_client import db
+from .dependency_graph import DependencyGraph
+from .redis_client import redis, stream_position
+from .ticket_types import TicketRelationType
+
+DEPENDENCY_TYPES = {TicketRelationType.BLOCKS.value, TicketRelationType.BLOCKED_BY.value}
+LOAD_PAGE_SIZE = 1000
+CHANGES_KEY = 'tickets:graph:changes'
+CHANGES_MAX_LENGTH = 10000
+ADDED = 'add'
+REMOVED = 'remove'
+
+
+def dependency_edge(ticket_id: str, related_ticket_id: str, relation_type: str) -> Optional[tuple]:
+    """Get the (blocked, blocker) pair of a relation, or None if it is not a dependency"""
+    if relation_type == TicketRelationType.BLOCKED_BY.value:
+        return ticket_id, related_ticket_id
+    if relation_type == TicketRelationType.BLOCKS.value:
+        return related_ticket_id, ticket_id
+    return None
+
+
+class TicketGraph(DependencyGraph):
+    def __init__(self, max_age: int = 300):
+        super().__init__()
+        self.db = db
+        self.max_age = max_age
+        self._redis = redis
+        self._loaded_at: Optional[float] = None
+        # Last change applied from the stream
+        self._stream_id = '0-0'
+        self._load_lock: Optional[asyncio.Lock] = None
+
+    async def ensure_loaded(self) -> None:
+        """Load the dependency edges, or bring them up to date with changes made elsewhere"""
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            try:
+                if self._loaded_at is not None and await self._catch_up():
+                    return
+                await self._load()
+            except Exception as e:
+                logger.error(f"Failed to load ticket dependency graph: {str(e)}")
+                raise
+
+    async def record(self, blocked: str, blocker: str, change: str = ADDED) -> None:
+        """Apply an edge change written by this process and announce it to the others"""
+        if change == ADDED:
+            self.add(blocked, blocker)
+        else:
+            self.remove(blocked, blocker)
+        if self._redis is None:
+            return
+        try:
+            await self._redis.xadd(
+                CHANGES_KEY,
+                {'change': change, 'blocked': blocked, 'blocker': blocker},
+                maxlen=CHANGES_MAX_LENGTH,
+                approximate=True
+            )
+        except Exception as e:
+            # Other processes miss this change until they next reload
+            logger.error(f"Failed to publish ticket dependency change: {str(e)}")
+
+    async def _load(self) -> None:
+        if self._redis is not None:
+            # Changes made while loading are applied again afterwards
+            latest = await self._redis.xrevrange(CHANGES_KEY, count=1)
+            self._stream_id = latest[0][0].decode() if latest else '0-0'
+
+        self.clear()
+        offset = 0
+        while True:
+            response = await self.db.table('ticket_dependencies').select(
+                'blocked, blocker'
+            ).order('blocked').order('blocker').range(
+                offset, offset + LOAD_PAGE_SIZE - 1
+            ).execute()
+            for edge in response.data:
+                self.add(edge['blocked'], edge['blocker'])
+            if len(response.data) < LOAD_PAGE_SIZE:
+                break
+            offset += LOAD_PAGE_SIZE
+
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded ticket dependency graph ({len(self._blocked_by)} blocked tickets)")
+
+    async def _catch_up(self) -> bool:
+        """Apply the changes made since the last use, False if a reload is needed"""
+        if self._redis is None:
+            return time.monotonic() - self._loaded_at < self.max_age
+
+        oldest = await self._redis.xrange(CHANGES_KEY, count=1)
+        if oldest and stream_position(oldest[0][0].decode()) > stream_position(self._stream_id):
+            # Changes since the last applied one may have been trimmed
+            return False
+
+        while True:
+            changes = await self._redis.xrange(CHANGES_KEY, min=f"({self._stream_id}", count=LOAD_PAGE_SIZE)
+            for stream_id, fields in changes:
+                blocked, blocker = fields[b'blocked'].decode(), fields[b'blocker'].decode()
+                if fields[b'change'] == ADDED.encode():
+                    self.add(blocked, blocker)
+                else:
+                    self.remove(blocked, blocker)
+                self._stream_id = stream_id.decode()
+            if len(changes) < LOAD_PAGE_SIZE:
+                return True
+
+
+# Initialize ticket graph
+ticket_graph = TicketGraph(settings.TICKET_CACHE_TTL)
@@ -1,14 +1,50 @@
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 from datetime import datetime, timezone
+from enum import Enum
 import uuid
+from postgrest.exceptions import APIError
+from pydantic import BaseModel
 from config import settings
 from utils.logger import logger
 from database.supabase_client import db
 from .ticket_types import (
     Ticket, TicketStatus, TicketPriority, TicketType,
-    TicketAssignment, TicketRelation, TicketComment,
-    TicketNotification, TicketUpdate, TicketReport
+    TicketAssignment, TicketRelation, TicketRelationType, TicketComment,
+    TicketNotification, TicketReport
 )
+from .notification_dispatcher import notification_dispatcher
+from .ticket_cache import ticket_cache
+from .ticket_graph import REMOVED, dependency_edge, ticket_graph
+from .due_date_scheduler import DUE_SOON, due_date_scheduler
+from .similarity_index import similarity_index
+
+# Columns returned by list_tickets unless asked otherwise; created_at and id
+# are the keyset cursor
+LIST_COLUMNS = 'id, title, status, priority, type, assignees, due_date, created_at'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# SQLSTATEs raised by the update_ticket and add_ticket_relation database functions
+TICKET_NOT_FOUND = 'P0002'
+VERSION_CONFLICT = '40001'
+INVALID_RELATION = '22023'
+DEPENDENCY_CYCLE = '23514'
+
+
+def _to_json(value: Any) -> Any:
+    """Convert a ticket field value to its JSON form"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, BaseModel):
+        return _to_json(value.dict())
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
 
 class TicketManager:
     def __init__(self):
@@ -56,6 +92,9 @@ class TicketManager:
 
             # Save to database
             await self.db.table('tickets').insert(ticket.dict()).execute()
+            await ticket_cache.put(_to_json(ticket.dict()))
+            await due_date_scheduler.record([ticket.dict()])
+            await similarity_index.record([ticket.dict()])
             
             # Create notifications for assignees
             if assignees:
@@ -72,56 +111,60 @@ class TicketManager:
         self,
         ticket_id: str,
         updates: Dict,
-        updated_by: str
+        updated_by: str,
+        expected_version: Optional[int] = None
     ) -> Ticket:
-        """Update a ticket"""
+        """
+        Update a ticket in a single round trip.
+        The update_ticket database function (sql/002_update_ticket.sql) writes
+        only the changed columns, its audit rows and the assignee notifications
+        in one transaction. Pass the version that was read as expected_version
+        to reject the update if the ticket changed in between.
+        """
         try:
-            # Get current ticket
-            ticket_data = await self.get_ticket(ticket_id)
-            if not ticket_data:
-                raise ValueError(f"Ticket {ticket_id} not found")
+            response = await self.db.rpc('update_ticket', {
+                'p_ticket_id': ticket_id,
+                'p_changes': {field: _to_json(value) for field, value in updates.items()},
+                'p_updated_by': updated_by,
+                'p_expected_version': expected_version
+            }).execute()
 
-            ticket = Ticket(**ticket_data)
-            
-            # Track updates for notification
-            updates_description = []
-            
-            for field, new_value in updates.items():
-                old_value = getattr(ticket, field)
-                if old_value != new_value:
-                    # Record update
-                    update = TicketUpdate(
-                        field=field,
-                        old_value=str(old_value) if old_value else None,
-                        new_value=str(new_value),
-                        updated_by=updated_by
-                    )
-                    await self.db.table('ticket_updates').insert(update.dict()).execute()
-                    
-                    updates_description.append(f"{field}: {old_value} → {new_value}")
-                    
-                    # Update ticket
-                    setattr(ticket, field, new_value)
-
-            if updates_description:
-                ticket.updated_at = datetime.now(timezone.utc)
-                await self.db.table('tickets').update(ticket.dict()).eq('id', ticket_id).execute()
-                
-                # Create notification for changes
-                await self._create_update_notification(ticket, updates_description)
-
-            logger.info(f"Updated ticket {ticket_id}")
+            await ticket_cache.put(response.data['ticket'])
+            await due_date_scheduler.record([response.data['ticket']])
+            if {'title', 'description'} & {change['field'] for change in response.data['changes'] or []}:
+                await similarity_index.record([response.data['ticket']])
+            ticket = Ticket(**response.data['ticket'])
+            await notification_dispatcher.publish(response.data['notifications'])
+            logger.info(f"Updated ticket {ticket_id} ({len(response.data['changes'] or [])} fields changed)")
             return ticket
 
+        except APIError as e:
+            logger.error(f"Failed to update ticket: {e.message}")
+            if e.code == TICKET_NOT_FOUND:
+                raise ValueError(f"Ticket {ticket_id} not found") from e
+            if e.code == VERSION_CONFLICT:
+                # The caller may have read the version from a stale cache entry
+                await ticket_cache.invalidate(ticket_id)
+                raise ValueError(f"Ticket {ticket_id} was modified by someone else, reload and retry") from e
+            raise
         except Exception as e:
             logger.error(f"Failed to update ticket: {str(e)}")
             raise
 
-    async def get_ticket(self, ticket_id: str) -> Optional[Dict]:
-        """Get a ticket by ID"""
+    async def get_ticket(self, ticket_id: str, use_cache: bool = True) -> Optional[Dict]:
+        """Get a ticket by ID, served from the ticket cache when possible"""
         try:
+            if use_cache:
+                ticket = await ticket_cache.get(ticket_id)
+                if ticket is not None:
+                    return ticket
+
             response = await self.db.table('tickets').select('*').eq('id', ticket_id).execute()
-            return response.data[0] if response.data else None
+            if not response.data:
+                return None
+
+            await ticket_cache.put(response.data[0])
+            return response.data[0]
         except Exception as e:
             logger.error(f"Failed to get ticket: {str(e)}")
             raise
@@ -131,22 +174,37 @@ class TicketManager:
         status: Optional[TicketStatus] = None,
         priority: Optional[TicketPriority] = None,
         assigned_to: Optional[str] = None,
-        created_by: Optional[str] = None
+        created_by: Optional[str] = None,
+        columns: str = LIST_COLUMNS,
+        limit: int = DEFAULT_PAGE_SIZE,
+        after: Optional[Dict] = None
     ) -> List[Dict]:
-        """List tickets with optional filters"""
+        """
+        List a page of tickets with optional filters, newest first.
+        Pass the last ticket of the previous page as ``after`` for the next
+        page (keyset pagination on created_at and id).
+        """
         try:
-            query = self.db.table('tickets').select('*')
+            query = self.db.table('tickets').select(columns)
             
             if status:
-                query = query.eq('status', status)
+                query = query.eq('status', _to_json(status))
             if priority:
-                query = query.eq('priority', priority)
+                query = query.eq('priority', _to_json(priority))
             if assigned_to:
+                # Served by the GIN index on assignees (sql/003_ticket_listing.sql)
                 query = query.contains('assignees', [{"user_id": assigned_to}])
             if created_by:
                 query = query.eq('creator_id', created_by)
+            if after:
+                query = query.or_(
+                    f'created_at.lt."{after["created_at"]}",'
+                    f'and(created_at.eq."{after["created_at"]}",id.lt."{after["id"]}")'
+                )
 
-            response = await query.execute()
+            response = await query.order('created_at', desc=True).order('id', desc=True).limit(
+                min(limit, MAX_PAGE_SIZE)
+            ).execute()
             return response.data
 
         except Exception as e:
@@ -189,78 +247,167 @@ class TicketManager:
         related_ticket_id: str,
         relation_type: str
     ) -> TicketRelation:
-        """Add a relation between tickets"""
+        """
+        Add a relation between tickets.
+        Relations are rows of the ticket_relations table
+        (sql/004_ticket_relations.sql); blocks/blocked_by relations that
+        would create a dependency cycle are rejected.
+        """
         try:
             relation = TicketRelation(
                 relation_type=relation_type,
                 ticket_id=related_ticket_id
             )
-            
-            # Update ticket relations
-            ticket = await self.get_ticket(ticket_id)
-            if not ticket:
-                raise ValueError(f"Ticket {ticket_id} not found")
-                
-            relations = ticket.get("relations", [])
-            relations.append(relation.dict())
-            
-            await self.db.table('tickets').update(
-                {"relations": relations}
-            ).eq('id', ticket_id).execute()
+            relation_type = _to_json(relation.relation_type)
+
+            edge = dependency_edge(ticket_id, related_ticket_id, relation_type)
+            if edge:
+                await ticket_graph.ensure_loaded()
+                cycle = ticket_graph.find_cycle(*edge)
+                if cycle:
+                    raise ValueError(f"Relation would create a dependency cycle: {' -> '.join(cycle)}")
+
+            # Checks both tickets exist and, for dependencies, re-checks for
+            # cycles under a lock in case another process added edges
+            await self.db.rpc('add_ticket_relation', {
+                'p_ticket_id': ticket_id,
+                'p_related_ticket_id': related_ticket_id,
+                'p_relation_type': relation_type
+            }).execute()
+            if edge:
+                await ticket_graph.record(*edge)
 
             logger.info(f"Added relation between tickets {ticket_id} and {related_ticket_id}")
             return relation
 
+        except APIError as e:
+            logger.error(f"Failed to add relation: {e.message}")
+            if e.code == TICKET_NOT_FOUND:
+                raise ValueError(f"Ticket {ticket_id} or {related_ticket_id} not found") from e
+            if e.code == INVALID_RELATION:
+                raise ValueError(f"Ticket {ticket_id} cannot be related to itself") from e
+            if e.code == DEPENDENCY_CYCLE:
+                raise ValueError(f"Relation would create a dependency cycle: {e.message}") from e
+            raise
         except Exception as e:
             logger.error(f"Failed to add relation: {str(e)}")
             raise
 
+    async def remove_relation(
+        self,
+        ticket_id: str,
+        related_ticket_id: str,
+        relation_type: str
+    ) -> bool:
+        """Remove a relation between tickets, returning whether it existed"""
+        try:
+            relation_type = TicketRelationType(relation_type).value
+            response = await self.db.table('ticket_relations').delete().eq(
+                'ticket_id', ticket_id
+            ).eq('related_ticket_id', related_ticket_id).eq(
+                'relation_type', relation_type
+            ).execute()
+
+            edge = dependency_edge(ticket_id, related_ticket_id, relation_type)
+            if response.data and edge:
+                await ticket_graph.record(*edge, change=REMOVED)
+
+            logger.info(f"Removed relation between tickets {ticket_id} and {related_ticket_id}")
+            return bool(response.data)
+
+        except Exception as e:
+            logger.error(f"Failed to remove relation: {str(e)}")
+            raise
+
+    async def find_similar_tickets(self, title: str, description: str, limit: int = 5) -> List[Dict]:
+        """
+        Get existing tickets that look like duplicates of the given text.
+        The index is loaded when the bot starts; until it is, no suggestions
+        are made rather than holding up ticket creation.
+        """
+        try:
+            if not similarity_index.loaded:
+                return []
+            await similarity_index.catch_up()
+            return similarity_index.query(title, description, limit=limit)
+        except Exception as e:
+            logger.error(f"Failed to find similar tickets: {str(e)}")
+            raise
+
+    async def get_blockers(self, ticket_id: str) -> List[str]:
+        """Get the IDs of every ticket the ticket is transitively blocked by"""
+        try:
+            await ticket_graph.ensure_loaded()
+            return sorted(ticket_graph.blockers(ticket_id))
+        except Exception as e:
+            logger.error(f"Failed to get blockers: {str(e)}")
+            raise
+
+    async def get_critical_path(
+        self,
+        ticket_id: Optional[str] = None,
+        exclude: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Get the longest chain of dependencies, first blocker first,
+        optionally only the chains leading to ticket_id
+        """
+        try:
+            await ticket_graph.ensure_loaded()
+            return ticket_graph.critical_path(ticket_id, exclude=exclude or ())
+        except Exception as e:
+            logger.error(f"Failed to get critical path: {str(e)}")
+            raise
+
     async def generate_report(self) -> TicketReport:
-        """Generate a ticket statistics report"""
+        """
+        Generate a ticket statistics report.
+        Counts come from the ticket_stats summary kept current by a trigger
+        on tickets (sql/001_ticket_stats.sql), so the cost does not grow
+        with the number of tickets.
+        """
         try:
-            all_tickets = await self.db.table('tickets').select('*').execute()
-            tickets = all_tickets.data
-            
             now = datetime.now(timezone.utc)
-            
-            # Calculate statistics
-            total = len(tickets)
-            open_tickets = len([t for t in tickets if t["status"] == TicketStatus.OPEN.value])
-            completed = len([t for t in tickets if t["status"] == TicketStatus.COMPLETED.value])
-            overdue = len([
-                t for t in tickets 
-                if t["due_date"] and datetime.fromisoformat(t["due_date"]) < now
-                and t["status"] not in [TicketStatus.COMPLETED.value, TicketStatus.CLOSED.value]
-            ])
-            
+
+            stats = await self.db.table('ticket_stats').select(
+                'dimension, value, count, total_hours'
+            ).execute()
+
+            # Overdue depends on the current time, counted through the partial due date index
+            overdue = await self.db.table('tickets').select('id', count='exact', head=True).lt(
+                'due_date', now.isoformat()
+            ).not_.in_(
+                'status', [TicketStatus.COMPLETED.value, TicketStatus.CLOSED.value]
+            ).execute()
+
             # Group by categories
-            priority_count = {}
-            status_count = {}
-            type_count = {}
-            
-            for ticket in tickets:
-                priority_count[ticket["priority"]] = priority_count.get(ticket["priority"], 0) + 1
-                status_count[ticket["status"]] = status_count.get(ticket["status"], 0) + 1
-                type_count[ticket["type"]] = type_count.get(ticket["type"], 0) + 1
-            
-            # Calculate average completion time
-            completion_times = []
-            for ticket in tickets:
-                if ticket["status"] == TicketStatus.COMPLETED.value:
-                    created = datetime.fromisoformat(ticket["created_at"])
-                    completed = datetime.fromisoformat(ticket["updated_at"])
-                    completion_times.append((completed - created).total_seconds() / 3600)  # hours
-            
-            avg_completion_time = sum(completion_times) / len(completion_times) if completion_times else None
+            totals = {'priority': {}, 'status': {}, 'type': {}}
+            total = 0
+            completion = None
+            for row in stats.data:
+                if row["dimension"] == 'total':
+                    total = row["count"]
+                elif row["dimension"] == 'completion':
+                    completion = row
+                elif row["dimension"] in totals and row["count"]:
+                    totals[row["dimension"]][row["value"]] = row["count"]
+
+            status_count = totals['status']
+
+            # Average completion time in hours
+            avg_completion_time = (
+                completion["total_hours"] / completion["count"]
+                if completion and completion["count"] else None
+            )
 
             report = TicketReport(
                 total_tickets=total,
-                open_tickets=open_tickets,
-                completed_tickets=completed,
-                overdue_tickets=overdue,
-                tickets_by_priority=priority_count,
+                open_tickets=status_count.get(TicketStatus.OPEN.value, 0),
+                completed_tickets=status_count.get(TicketStatus.COMPLETED.value, 0),
+                overdue_tickets=overdue.count or 0,
+                tickets_by_priority=totals['priority'],
                 tickets_by_status=status_count,
-                tickets_by_type=type_count,
+                tickets_by_type=totals['type'],
                 average_completion_time=avg_completion_time
             )
 
@@ -271,6 +418,44 @@ class TicketManager:
             logger.error(f"Failed to generate report: {str(e)}")
             raise
 
+    async def notify_due_date(self, ticket_id: str, event: str) -> None:
+        """Notify the assignees of a ticket that is due soon or overdue"""
+        try:
+            # The event may predate a write the scheduler has not seen
+            ticket = await self.get_ticket(ticket_id, use_cache=False)
+            if not ticket:
+                return
+            if (
+                ticket["status"] in (TicketStatus.COMPLETED.value, TicketStatus.CLOSED.value)
+                or not due_date_scheduler.is_scheduled(ticket)
+            ):
+                # Closed or rescheduled elsewhere, schedule what is stored now
+                due_date_scheduler.track(ticket)
+                return
+
+            if event == DUE_SOON:
+                message = f"Ticket #{ticket_id} is due {ticket['due_date']}: {ticket['title']}"
+            else:
+                message = f"Ticket #{ticket_id} is overdue: {ticket['title']}"
+            notifications = [
+                TicketNotification(
+                    id=str(uuid.uuid4()),
+                    ticket_id=ticket_id,
+                    user_id=assignee["user_id"],
+                    type=event,
+                    message=message
+                ).dict()
+                for assignee in ticket["assignees"]
+            ]
+
+            if notifications:
+                await self.db.table('ticket_notifications').insert(notifications).execute()
+                await notification_dispatcher.publish(notifications)
+
+        except Exception as e:
+            logger.error(f"Failed to create due date notifications: {str(e)}")
+            raise
+
     async def _create_assignment_notifications(
         self,
         ticket: Ticket,
@@ -290,37 +475,12 @@ class TicketManager:
             ]
             
             await self.db.table('ticket_notifications').insert(notifications).execute()
+            await notification_dispatcher.publish(notifications)
             
         except Exception as e:
             logger.error(f"Failed to create assignment notifications: {str(e)}")
             raise
 
-    async def _create_update_notification(
-        self,
-        ticket: Ticket,
-        updates: List[str]
-    ) -> None:
-        """Create notifications for ticket updates"""
-        try:
-            assignees = [a.user_id for a in ticket.assignees]
-            if assignees:
-                notifications = [
-                    TicketNotification(
-                        id=str(uuid.uuid4()),
-                        ticket_id=ticket.id,
-                        user_id=assignee,
-                        type="update",
-                        message=f"Ticket #{ticket.id} was updated: {', '.join(updates)}"
-                    ).dict()
-                    for assignee in assignees
-                ]
-                
-                await self.db.table('ticket_notifications').insert(notifications).execute()
-                
-        except Exception as e:
-            logger.error(f"Failed to create update notifications: {str(e)}")
-            raise
-
     async def _create_comment_notification(
         self,
         ticket: Dict,
@@ -343,6 +503,7 @@ class TicketManager:
             
             if notifications:
                 await self.db.table('ticket_notifications').insert(notifications).execute()
+                await notification_dispatcher.publish(notifications)
                 
         except Exception as e:
             logger.error(f"Failed to create comment notifications: {str(e)}")
@@ -0,0 +1,258 @@
+"""
+Streaming bulk import and export of tickets as CSV or JSONL.
+
+Import reads records lazily, validates them through the Ticket model one
+chunk at a time and writes each chunk with a single insert, so memory use
+depends on the chunk size and not on the number of tickets. Assignment
+notifications are skipped by default (a migration should not page everyone);
+with notify=True they are written with one insert per chunk after its
+tickets. Imported tickets are announced to the bot's due date scheduler and
+similarity index over Redis; without REDIS_URL the bot only schedules and
+indexes them on its next start. Export walks the tickets newest first over
+keyset pages.
+
+Usage from web/core:
+
+    python -m tickets.ticket_transfer import tickets.csv --created-by <user id>
+    python -m tickets.ticket_transfer export tickets.jsonl
+"""
+import argparse
+import asyncio
+import csv
+import json
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import islice
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, TextIO, Union
+from pydantic import ValidationError
+from utils.logger import logger
+from database.supabase_client import db
+from .ticket_types import Ticket, TicketNotification, TicketStatus
+from .ticket_manager import MAX_PAGE_SIZE, ticket_manager, _to_json
+from .notification_dispatcher import notification_dispatcher
+from .due_date_scheduler import due_date_scheduler
+from .redis_client import redis
+from .similarity_index import similarity_index
+
+EXPORT_COLUMNS = [
+    'id', 'title', 'description', 'type', 'priority', 'status', 'creator_id',
+    'created_at', 'updated_at', 'due_date', 'assignees', 'labels',
+    'github_pr', 'github_issue'
+]
+# Stored as JSON inside a CSV cell
+JSON_COLUMNS = {'assignees', 'labels'}
+DEFAULT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    skipped: int = 0
+    failed: int = 0
+    # (record number, message), capped at MAX_REPORTED_ERRORS
+    errors: List[tuple] = field(default_factory=list)
+
+
+def _format_of(path: str) -> str:
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+        return 'jsonl'
+    raise ValueError(f"Cannot tell the format of {path}, use a .csv or .jsonl file")
+
+
+def read_records(file: TextIO, file_format: str) -> Iterator[Union[str, Dict]]:
+    """
+    Read ticket records from a CSV or JSONL file one at a time.
+    JSON is left undecoded (whole JSONL lines, JSON cells of CSV rows) so a
+    malformed record fails on its own during validation.
+    """
+    if file_format == 'jsonl':
+        for line in file:
+            if line.strip():
+                yield line
+        return
+
+    for row in csv.DictReader(file):
+        yield {column: value for column, value in row.items() if value != '' and value is not None}
+
+
+def _csv_row(record: Dict) -> Dict:
+    return {
+        column: json.dumps(value) if column in JSON_COLUMNS else value
+        for column, value in record.items()
+    }
+
+
+class TicketTransfer:
+    def __init__(self):
+        self.db = db
+
+    async def import_tickets(
+        self,
+        records: Iterable[Union[str, Dict]],
+        created_by: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        notify: bool = False
+    ) -> ImportResult:
+        """
+        Import ticket records in chunks.
+        Records are dicts or JSON lines; JSON columns may be JSON strings.
+        Records without an id, status or creator get a new id, open and
+        created_by. Tickets whose id already exists are skipped, so an
+        interrupted import can be re-run from the start.
+        """
+        result = ImportResult()
+        records = iter(records)
+        number = 0
+        try:
+            while chunk := list(islice(records, chunk_size)):
+                tickets = []
+                for record in chunk:
+                    number += 1
+                    try:
+                        tickets.append(self._validate(record, created_by))
+                    except (ValidationError, ValueError, TypeError) as e:
+                        result.failed += 1
+                        if len(result.errors) < MAX_REPORTED_ERRORS:
+                            result.errors.append((number, str(e)))
+
+                if tickets:
+                    inserted = await self._insert_chunk(tickets)
+                    result.imported += len(inserted)
+                    result.skipped += len(tickets) - len(inserted)
+                    if notify:
+                        await self._notify_assignees(inserted)
+
+                logger.info(f"Imported {result.imported} tickets ({number} records read)")
+
+            return result
+
+        except Exception as e:
+            logger.error(f"Failed to import tickets at record {number}: {str(e)}")
+            raise
+
+    async def export_tickets(self, page_size: int = MAX_PAGE_SIZE, **filters) -> AsyncIterator[Dict]:
+        """Yield every ticket matching the list_tickets filters, newest first"""
+        # list_tickets clamps the limit, a larger page would look like the last one
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        after = None
+        while True:
+            page = await ticket_manager.list_tickets(
+                columns=', '.join(EXPORT_COLUMNS),
+                limit=page_size,
+                after=after,
+                **filters
+            )
+            for ticket in page:
+                yield ticket
+            if len(page) < page_size:
+                return
+            after = page[-1]
+
+    async def import_file(self, path: str, created_by: str, **options) -> ImportResult:
+        """Import tickets from a .csv or .jsonl file"""
+        with open(path, newline='', encoding='utf-8') as file:
+            return await self.import_tickets(read_records(file, _format_of(path)), created_by, **options)
+
+    async def export_file(self, path: str, **filters) -> int:
+        """Export tickets to a .csv or .jsonl file, returning how many were written"""
+        file_format = _format_of(path)
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            if file_format == 'csv':
+                writer = csv.DictWriter(file, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+                writer.writeheader()
+            async for ticket in self.export_tickets(**filters):
+                if file_format == 'csv':
+                    writer.writerow(_csv_row(ticket))
+                else:
+                    file.write(json.dumps(ticket, default=str) + '\n')
+                count += 1
+
+        logger.info(f"Exported {count} tickets to {path}")
+        return count
+
+    def _validate(self, record: Union[str, Dict], created_by: str) -> Dict:
+        if isinstance(record, str):
+            record = json.loads(record)
+        if not isinstance(record, dict):
+            raise TypeError(f"Expected an object, got {type(record).__name__}")
+        record = {column: value for column, value in record.items() if column in EXPORT_COLUMNS}
+        for column in JSON_COLUMNS & record.keys():
+            if isinstance(record[column], str):
+                record[column] = json.loads(record[column])
+        record.setdefault('id', str(uuid.uuid4()))
+        record.setdefault('status', TicketStatus.OPEN.value)
+        record.setdefault('creator_id', created_by)
+        record.setdefault('created_at', datetime.now(timezone.utc))
+        for assignee in record.get('assignees') or []:
+            if not isinstance(assignee, dict):
+                raise TypeError(f"Expected assignee objects, got {type(assignee).__name__}")
+            assignee.setdefault('assigned_by', created_by)
+        return _to_json(Ticket(**record).dict())
+
+    async def _insert_chunk(self, tickets: List[Dict]) -> List[Dict]:
+        response = await self.db.table('tickets').upsert(
+            tickets,
+            on_conflict='id',
+            ignore_duplicates=True
+        ).execute()
+        # Only newly inserted rows come back
+        await due_date_scheduler.record(response.data)
+        await similarity_index.record(response.data)
+        return response.data
+
+    async def _notify_assignees(self, tickets: List[Dict]) -> None:
+        notifications = [
+            TicketNotification(
+                id=str(uuid.uuid4()),
+                ticket_id=ticket['id'],
+                user_id=assignee['user_id'],
+                type="assignment",
+                message=f"You have been assigned to ticket #{ticket['id']}: {ticket['title']}"
+            ).dict()
+            for ticket in tickets
+            for assignee in ticket.get('assignees') or []
+        ]
+        if notifications:
+            await self.db.table('ticket_notifications').insert(notifications).execute()
+            await notification_dispatcher.publish(notifications)
+
+
+# Initialize ticket transfer
+ticket_transfer = TicketTransfer()
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk import or export tickets")
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('path', help="A .csv or .jsonl file")
+    parser.add_argument('--created-by', help="Creator of records without one (import)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--notify', action='store_true', help="Notify assignees of imported tickets")
+    args = parser.parse_args(argv)
+
+    if args.action == 'export':
+        await ticket_transfer.export_file(args.path)
+        return
+
+    if not args.created_by:
+        parser.error("--created-by is required for import")
+    result = await ticket_transfer.import_file(
+        args.path,
+        args.created_by,
+        chunk_size=args.chunk_size,
+        notify=args.notify
+    )
+    print(f"Imported {result.imported}, skipped {result.skipped} existing, {result.failed} invalid")
+    for number, message in result.errors:
+        print(f"  record {number}: {message}")
+    if result.imported and redis is None:
+        print("REDIS_URL is not set, restart the bot to schedule due dates and find duplicates of the imported tickets")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
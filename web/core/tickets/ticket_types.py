@@ -62,11 +62,11 @@ class Ticket(BaseModel):
     updated_at: Optional[datetime] = None
     due_date: Optional[datetime] = None
     assignees: List[TicketAssignment] = []
-    relations: List[TicketRelation] = []
     comments: List[TicketComment] = []
     labels: List[str] = []
     github_pr: Optional[str] = None
     github_issue: Optional[str] = None
+    version: int = 1
 
     class Config:
         use_enum_values = True
@@ -81,6 +81,7 @@ class TicketNotification(BaseModel):
     read: bool = False
 
 class TicketUpdate(BaseModel):
+    ticket_id: Optional[str] = None
     field: str
     old_value: Optional[str]
     new_value: str
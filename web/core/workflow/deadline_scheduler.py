@@ -0,0 +1,96 @@
+"""
+Deadline scheduler for workflow timeouts.
+
+Each key has at most one pending deadline, kept in a min-heap. The runner
+sleeps until the earliest deadline and is woken early when an earlier one is
+scheduled, so its cost depends on the deadlines that fire and not on how
+many workflows are active. Rescheduling or cancelling a key does not search
+the heap: the key's sequence number changes and its old entry is skipped
+when popped. Once stale entries outnumber the pending deadlines by
+COMPACT_FACTOR the heap is rebuilt from the pending ones, so keys that are
+rescheduled often do not grow it without bound.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Standard logging keeps the scheduler importable without the bot's config
+logger = logging.getLogger(__name__)
+
+COMPACT_FACTOR = 4
+# Small heaps are not worth rebuilding
+COMPACT_MIN_SIZE = 64
+
+OnDeadline = Callable[[str], Awaitable[None]]
+
+
+class DeadlineScheduler:
+    def __init__(self):
+        # (deadline, sequence, key)
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._sequences: Dict[str, int] = {}
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def wakeup(self) -> asyncio.Event:
+        # Created lazily so it binds to the running loop
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def schedule(self, key: str, deadline: Optional[datetime]) -> None:
+        """Set or replace the deadline of a key, None cancels it"""
+        if deadline is None:
+            self.cancel(key)
+            return
+
+        sequence = next(self._counter)
+        self._sequences[key] = sequence
+        heapq.heappush(self._heap, (deadline, sequence, key))
+        if self._heap[0][1] == sequence:
+            self.wakeup.set()
+        self._compact()
+
+    def cancel(self, key: str) -> None:
+        """Drop the deadline of a key"""
+        self._sequences.pop(key, None)
+        self._compact()
+
+    def _compact(self) -> None:
+        """Drop the entries of rescheduled and cancelled keys once they dominate the heap"""
+        if len(self._heap) <= max(COMPACT_FACTOR * len(self._sequences), COMPACT_MIN_SIZE):
+            return
+        self._heap = [entry for entry in self._heap if self._sequences.get(entry[2]) == entry[1]]
+        heapq.heapify(self._heap)
+
+    async def run(self, on_deadline: OnDeadline) -> None:
+        """Call on_deadline for each key as its deadline passes, until cancelled"""
+        while True:
+            self.wakeup.clear()
+            delay = None
+            if self._heap:
+                delay = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, sequence, key = heapq.heappop(self._heap)
+            if self._sequences.get(key) != sequence:
+                # Rescheduled or cancelled since
+                continue
+            del self._sequences[key]
+
+            try:
+                await on_deadline(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error handling deadline of {key}: {str(e)}")
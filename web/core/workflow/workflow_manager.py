@@ -1,6 +1,6 @@
 import uuid
 from typing import List, Dict, Optional, Tuple
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import asyncio
 from config import settings
 from utils.logger import logger
@@ -11,12 +11,14 @@ from .workflow_types import (
     WorkflowStage, WorkflowProgress, WorkflowDependency,
     WORKFLOW_DEFINITIONS
 )
+from .deadline_scheduler import DeadlineScheduler
 
 class WorkflowManager:
     def __init__(self):
         """Initialize workflow manager"""
         self.active_workflows: Dict[str, Workflow] = {}
         self._monitoring_task = None
+        self._deadlines = DeadlineScheduler()
 
     async def create_workflow(
         self,
@@ -84,6 +86,7 @@ class WorkflowManager:
             
             # Add to active workflows
             self.active_workflows[workflow_id] = workflow
+            self._schedule_timeout(workflow)
             
             # Start monitoring if not already running
             await self.ensure_monitoring()
@@ -130,6 +133,10 @@ class WorkflowManager:
             
             # Save changes
             await self.save_workflow(workflow)
+
+            # Stage changes move the next timeout
+            if workflow_id in self.active_workflows:
+                self._schedule_timeout(workflow)
             
             return workflow
 
@@ -185,47 +192,61 @@ class WorkflowManager:
             logger.error(f"Failed to update workflow state: {str(e)}")
             raise
 
+    def _schedule_timeout(self, workflow: Workflow) -> None:
+        """(Re)schedule the next timeout check of an active workflow"""
+        if workflow.state in [WorkflowState.COMPLETED, WorkflowState.FAILED, WorkflowState.CANCELLED]:
+            self.active_workflows.pop(workflow.id, None)
+            self._deadlines.cancel(workflow.id)
+            return
+
+        deadlines = []
+        if workflow.created_at:
+            workflow_def = WORKFLOW_DEFINITIONS[workflow.type]
+            deadlines.append(workflow.created_at + timedelta(minutes=workflow_def.timeout_minutes))
+
+        current_stage = workflow.current_stage()
+        if current_stage and current_stage.state == WorkflowState.IN_PROGRESS and current_stage.started_at:
+            deadlines.append(current_stage.started_at + timedelta(minutes=current_stage.timeout_minutes))
+
+        self._deadlines.schedule(workflow.id, min(deadlines) if deadlines else None)
+
+    async def _handle_timeout(self, workflow_id: str) -> None:
+        """Apply the workflow or stage timeout that just passed"""
+        workflow = self.active_workflows.get(workflow_id)
+        if not workflow:
+            return
+
+        # Check workflow timeout
+        if workflow.is_timed_out():
+            workflow.state = WorkflowState.FAILED
+            workflow.progress.blockers.append("Workflow timeout")
+            await self.save_workflow(workflow)
+            self._schedule_timeout(workflow)
+            return
+
+        # Check stage timeouts
+        current_stage = workflow.current_stage()
+        if current_stage and current_stage.state == WorkflowState.IN_PROGRESS and current_stage.started_at:
+            timeout = current_stage.started_at + timedelta(minutes=current_stage.timeout_minutes)
+            if datetime.utcnow() > timeout:
+                if current_stage.retry_count < current_stage.max_retries:
+                    # Retry stage
+                    current_stage.retry_count += 1
+                    current_stage.started_at = datetime.utcnow()
+                    logger.info(f"Retrying stage {current_stage.name} in workflow {workflow_id}")
+                else:
+                    # Mark stage as failed
+                    current_stage.state = WorkflowState.FAILED
+                    logger.error(f"Stage {current_stage.name} in workflow {workflow_id} failed after max retries")
+
+                await self.save_workflow(workflow)
+
+        self._schedule_timeout(workflow)
+
     async def monitor_workflows(self) -> None:
-        """Monitor active workflows for timeouts and state updates"""
+        """Handle workflow and stage timeouts as they come due"""
         try:
-            while True:
-                for workflow_id, workflow in list(self.active_workflows.items()):
-                    try:
-                        # Check workflow timeout
-                        if workflow.is_timed_out():
-                            workflow.state = WorkflowState.FAILED
-                            workflow.progress.blockers.append("Workflow timeout")
-                            await self.save_workflow(workflow)
-                            continue
-
-                        # Check stage timeouts
-                        current_stage = workflow.current_stage()
-                        if current_stage and current_stage.state == WorkflowState.IN_PROGRESS:
-                            if current_stage.started_at:
-                                timeout = current_stage.started_at + \
-                                    timedelta(minutes=current_stage.timeout_minutes)
-                                if datetime.utcnow() > timeout:
-                                    if current_stage.retry_count < current_stage.max_retries:
-                                        # Retry stage
-                                        current_stage.retry_count += 1
-                                        current_stage.started_at = datetime.utcnow()
-                                        logger.info(f"Retrying stage {current_stage.name} in workflow {workflow_id}")
-                                    else:
-                                        # Mark stage as failed
-                                        current_stage.state = WorkflowState.FAILED
-                                        logger.error(f"Stage {current_stage.name} in workflow {workflow_id} failed after max retries")
-                                    
-                                    await self.save_workflow(workflow)
-
-                        # Remove completed/failed workflows from active monitoring
-                        if workflow.state in [WorkflowState.COMPLETED, WorkflowState.FAILED, WorkflowState.CANCELLED]:
-                            self.active_workflows.pop(workflow_id)
-
-                    except Exception as e:
-                        logger.error(f"Error monitoring workflow {workflow_id}: {str(e)}")
-
-                await asyncio.sleep(60)  # Check every minute
-
+            await self._deadlines.run(self._handle_timeout)
         except Exception as e:
             logger.error(f"Error in workflow monitor: {str(e)}")
             self._monitoring_task = None
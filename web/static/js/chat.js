@@ -87,18 +87,20 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!response.ok) throw new Error('Network response was not ok');
             
             const data = await response.json();
-            
+            if (data.status !== 'accepted') {
+                throw new Error(data.message || 'Invalid response format');
+            }
+
+            // The AI reply is delivered over the conversation socket
+            const reply = await waitForReply(data.conversation_id, data.after_seq);
+
             // Remove typing indicator
             typingIndicator.remove();
 
             // Add AI response
-            if (data.status === 'success' && data.message) {
-                const aiMessageElement = createMessageElement(data.message.content, true, data.message.created_at);
-                messagesContainer.appendChild(aiMessageElement);
-                scrollToBottom();
-            } else {
-                throw new Error(data.message || 'Invalid response format');
-            }
+            const aiMessageElement = createMessageElement(reply.content, true, formatTime(reply.created_at));
+            messagesContainer.appendChild(aiMessageElement);
+            scrollToBottom();
         } catch (error) {
             console.error('Error:', error);
             typingIndicator.remove();
@@ -112,6 +114,43 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Wait on the conversation socket for the first reply after a sequence number
+    function waitForReply(conversationId, afterSeq) {
+        return new Promise((resolve, reject) => {
+            const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+            const socket = new WebSocket(`${scheme}://${window.location.host}/ws/chat/${conversationId}/`);
+
+            socket.addEventListener('open', function() {
+                // Replays the reply if it was sent before the socket connected
+                socket.send(JSON.stringify({ type: 'resume', after_seq: afterSeq }));
+            });
+
+            socket.addEventListener('message', function(e) {
+                const data = JSON.parse(e.data);
+                if (data.type === 'error') {
+                    socket.close();
+                    reject(new Error(data.message));
+                } else if (data.role && data.role !== 'user' && data.seq > afterSeq) {
+                    socket.close();
+                    if (data.metadata && data.metadata.error) {
+                        reject(new Error(data.content));
+                    } else {
+                        resolve(data);
+                    }
+                }
+            });
+
+            socket.addEventListener('close', function() {
+                reject(new Error('Connection closed before the response arrived'));
+            });
+        });
+    }
+
+    function formatTime(isoTimestamp) {
+        const date = isoTimestamp ? new Date(isoTimestamp) : new Date();
+        return date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+    }
+
     // Create message element
     function createMessageElement(content, isAi, timestamp) {
         const div = document.createElement('div');
@@ -0,0 +1,79 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const history = document.getElementById('messageHistory');
+    if (!history || !history.dataset.historyUrl) return;
+
+    const historyUrl = history.dataset.historyUrl;
+    const author = history.dataset.aiAuthor;
+    let hasOlder = history.dataset.hasOlder === 'true';
+    let loading = false;
+
+    // Start at the latest message
+    history.scrollTop = history.scrollHeight;
+
+    // Load the previous page when the user scrolls near the top
+    history.addEventListener('scroll', function() {
+        if (history.scrollTop < 200 && hasOlder && !loading) {
+            loadOlderMessages();
+        }
+    });
+
+    async function loadOlderMessages() {
+        const oldest = history.querySelector('[data-message-id]');
+        if (!oldest) {
+            hasOlder = false;
+            return;
+        }
+
+        loading = true;
+        try {
+            // Pages before a cursor are stable, so the browser cache revalidates them by ETag
+            const response = await fetch(`${historyUrl}?before=${oldest.dataset.messageId}`, {
+                credentials: 'same-origin',
+                headers: { 'Accept': 'application/json' }
+            });
+            if (!response.ok) throw new Error('Failed to load older messages');
+
+            const messages = await response.json();
+            if (messages.length === 0) {
+                hasOlder = false;
+                return;
+            }
+
+            // Keep the visible messages in place while prepending
+            const previousHeight = history.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            messages.forEach(function(message) {
+                fragment.appendChild(createMessageElement(message));
+            });
+            history.insertBefore(fragment, history.firstChild);
+            history.scrollTop += history.scrollHeight - previousHeight;
+        } catch (error) {
+            console.error('Error:', error);
+        } finally {
+            loading = false;
+        }
+    }
+
+    function createMessageElement(message) {
+        const div = document.createElement('div');
+        div.className = `message ${message.is_ai ? 'message-ai' : 'message-user'}`;
+        div.dataset.messageId = message.id;
+
+        const header = document.createElement('div');
+        header.className = 'message-header';
+        const authorSpan = document.createElement('span');
+        authorSpan.className = 'message-author';
+        authorSpan.textContent = message.is_ai ? author : 'You';
+        const timeSpan = document.createElement('span');
+        timeSpan.className = 'message-time';
+        timeSpan.textContent = new Date(message.created_at).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+        header.append(authorSpan, timeSpan);
+
+        const content = document.createElement('div');
+        content.className = 'message-content';
+        content.textContent = message.content;
+
+        div.append(header, content);
+        return div;
+    }
+});